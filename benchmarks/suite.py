@@ -0,0 +1,316 @@
+"""
+Benchmarks of preprocessing and matching.
+
+Runs offline on `data/1-train-balanced-3600.csv` scaled up with seeded
+synthetic variations, measures throughput and peak memory and writes
+results to JSON, so runs of different revisions can be compared.
+
+Examples:
+    python -m benchmarks.suite run -s 10000 -s 100000 -o before.json
+    python -m benchmarks.suite compare before.json after.json
+"""
+
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import click
+import numpy as np
+import pandas as pd
+
+from cmnsim.fuzzy_clf import CNFuzzyClassifier
+from cmnsim.preprocessing import (
+    _PIPELINE_ORDER,
+    FullTransformersPipeline,
+    FusedNormalizer,
+    _make_stage,
+)
+from cmnsim.scoring import _has_rapidfuzz, score_pairs
+
+DATASET = Path(__file__).parent.parent.joinpath("data", "1-train-balanced-3600.csv")
+
+_LEGAL_FORMS = ["LLC", "Ltd.", "GmbH", "ООО", "S.A.", "Inc"]
+
+
+def _vary(name: str, rng: np.random.Generator) -> str:
+    """Make a synthetic variation of a company name."""
+
+    kind = rng.integers(4)
+    tokens = name.split()
+
+    if kind == 1 and len(tokens) > 1:
+        i = rng.integers(len(tokens) - 1)
+        tokens[i], tokens[i + 1] = tokens[i + 1], tokens[i]
+        return " ".join(tokens)
+
+    if kind == 2:
+        return f"{name} {_LEGAL_FORMS[rng.integers(len(_LEGAL_FORMS))]}"
+
+    if kind == 3 and len(name) > 3:
+        i = rng.integers(len(name))
+        return name[:i] + name[i + 1 :]
+
+    return name
+
+
+def load_pairs(dataset=DATASET) -> pd.DataFrame:
+    """Load labelled pairs of names."""
+    return pd.read_csv(dataset, index_col=0)
+
+
+def scale_names(names, size: int, seed: int = 0) -> np.ndarray:
+    """
+    Scale names up to `size` with seeded synthetic variations.
+
+    Args:
+        names: Source names.
+        size: Number of names to make.
+        seed: Random seed.
+
+    Returns:
+        Array of names.
+    """
+
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(np.asarray(names, dtype=object), size)
+    return np.array([_vary(name, rng) for name in sample], dtype=object)
+
+
+def scale_pairs(pairs: pd.DataFrame, size: int, seed: int = 0) -> np.ndarray:
+    """
+    Scale labelled pairs up to `size` with seeded synthetic variations.
+
+    Args:
+        pairs: DataFrame with `name_1` and `name_2` columns.
+        size: Number of pairs to make.
+        seed: Random seed.
+
+    Returns:
+        Array of shape (size, 2).
+    """
+
+    rng = np.random.default_rng(seed)
+    index = rng.integers(len(pairs), size=size)
+    sample = pairs[["name_1", "name_2"]].to_numpy()[index]
+    return np.array(
+        [[_vary(lhs, rng), _vary(rhs, rng)] for lhs, rhs in sample], dtype=object
+    )
+
+
+def measure(func, items: int, repeat: int = 1) -> dict:
+    """
+    Measure throughput and peak memory of a call.
+
+    The best of `repeat` timed runs is reported, peak memory is taken
+    from a separate run under `tracemalloc`, which slows code down.
+
+    Args:
+        func: Function without arguments.
+        items: Number of items processed by a call.
+        repeat: Number of timed runs.
+
+    Returns:
+        Dict with seconds, items per second and peak memory in bytes.
+    """
+
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "items": items,
+        "seconds": seconds,
+        "items_per_second": items / seconds if seconds else 0.0,
+        "peak_memory_bytes": peak,
+    }
+
+
+def _revision() -> str:
+    """Get git revision of the tree, if any."""
+
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_suite(sizes, pair_sizes, spacy=True, repeat=1, seed=0, echo=print) -> dict:
+    """
+    Run all benchmarks.
+
+    Args:
+        sizes: Numbers of names for preprocessing benchmarks.
+        pair_sizes: Numbers of pairs for classifier benchmarks.
+        spacy: Whether to include the spacy stage (needs the model).
+        repeat: Number of timed runs per benchmark.
+        seed: Random seed of synthetic data.
+        echo: Progress printer.
+
+    Returns:
+        Dict with run metadata and a list of results.
+    """
+
+    pairs = load_pairs()
+    names = pd.concat([pairs["name_1"], pairs["name_2"]]).to_numpy()
+    steps = [step for step in _PIPELINE_ORDER if spacy or step != "Spacy"]
+
+    results = []
+
+    def add(name, size, func, items):
+        echo(f"{name} [{size}]")
+        results.append({"name": name, "size": size, **measure(func, items, repeat)})
+
+    for size in sizes:
+        data = scale_names(names, size, seed)
+
+        for step in steps:
+            stage = _make_stage(step)
+            add(f"stage:{step}", size, lambda: stage.transform(data), size)
+
+        if spacy:
+            pipeline = FullTransformersPipeline()
+            add(
+                "FullTransformersPipeline", size, lambda: pipeline.transform(data), size
+            )
+
+        normalizer = FusedNormalizer(steps=steps)
+        add("FusedNormalizer", size, lambda: normalizer.transform(data), size)
+
+    backends = ["fuzzywuzzy", "rapidfuzz"] if _has_rapidfuzz() else ["fuzzywuzzy"]
+
+    clf = CNFuzzyClassifier()
+    X, y = pairs[["name_1", "name_2"]].to_numpy(), pairs["is_duplicate"].to_numpy()
+    calibrated = CNFuzzyClassifier(calibrate=True).fit(X, y)
+    cascade = CNFuzzyClassifier(calibrate=True, cascade=True).fit(X, y)
+
+    for size in pair_sizes:
+        data = scale_pairs(pairs, size, seed)
+
+        for backend in backends:
+            add(
+                f"score_pairs:{backend}",
+                size,
+                lambda: score_pairs(data, backend=backend),
+                size,
+            )
+
+        add(
+            "CNFuzzyClassifier.predict_proba",
+            size,
+            lambda: clf.predict_proba(data),
+            size,
+        )
+        add(
+            "CNFuzzyClassifier.predict:calibrated",
+            size,
+            lambda: calibrated.predict(data),
+            size,
+        )
+        add(
+            "CNFuzzyClassifier.predict:cascade",
+            size,
+            lambda: cascade.predict(data),
+            size,
+        )
+
+    return {
+        "meta": {
+            "revision": _revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "created": datetime.now(timezone.utc).isoformat(),
+            "seed": seed,
+            "repeat": repeat,
+            "spacy": spacy,
+        },
+        "results": results,
+    }
+
+
+def compare(before: dict, after: dict) -> str:
+    """
+    Compare two benchmark runs.
+
+    Args:
+        before: Baseline run.
+        after: New run.
+
+    Returns:
+        Text table with throughput and memory ratios (after / before).
+    """
+
+    def key(result):
+        return result["name"], result["size"]
+
+    baseline = {key(result): result for result in before["results"]}
+
+    lines = [f"{'benchmark':<40} {'size':>8} {'speedup':>8} {'memory':>8}"]
+    for result in after["results"]:
+        old = baseline.get(key(result))
+        if old is None:
+            continue
+
+        speedup = result["items_per_second"] / old["items_per_second"]
+        memory = result["peak_memory_bytes"] / max(old["peak_memory_bytes"], 1)
+        lines.append(
+            f"{result['name']:<40} {result['size']:>8} {speedup:>7.2f}x {memory:>7.2f}x"
+        )
+
+    return "\n".join(lines)
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.option("--size", "-s", "sizes", type=int, multiple=True, default=[10000])
+@click.option("--pairs", "-p", "pair_sizes", type=int, multiple=True, default=[10000])
+@click.option("--spacy/--no-spacy", default=True)
+@click.option("--repeat", "-r", type=int, default=1)
+@click.option("--seed", type=int, default=0)
+@click.option("--output", "-o", type=click.Path(dir_okay=False), required=True)
+def run(sizes, pair_sizes, spacy, repeat, seed, output):
+    """Run benchmarks and write results to JSON."""
+
+    report = run_suite(sizes, pair_sizes, spacy, repeat, seed, echo=click.echo)
+    Path(output).write_text(json.dumps(report, indent=2))
+    click.echo(f"Results saved to {output}")
+
+
+@cli.command(name="compare")
+@click.argument("before", type=click.Path(exists=True, dir_okay=False))
+@click.argument("after", type=click.Path(exists=True, dir_okay=False))
+def compare_command(before, after):
+    """Compare two JSON results."""
+
+    click.echo(
+        compare(
+            json.loads(Path(before).read_text()), json.loads(Path(after).read_text())
+        )
+    )
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,246 @@
+"""
+Module that contains a candidate blocking index for deduplication.
+
+Scoring all pairs of a large catalog is quadratic, the index generates
+only pairs of names which share enough character n-grams of their
+tokens, so only those get scored by `CNFuzzyClassifier`.
+"""
+
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+__all__ = [
+    "BlockingIndex",
+    "blocking_report",
+]
+
+# N-grams of fewer names are never dropped as frequent ones.
+_MIN_FREQUENT_DF = 100
+
+
+def _ngrams(name: str, n: int) -> Set[str]:
+    """
+    Character n-grams of the tokens of a name.
+
+    Tokens are processed as by fuzzywuzzy, but non-ASCII letters are
+    kept: fuzzywuzzy with ``force_ascii`` drops e.g. "ü" and "é".
+    """
+
+    from fuzzywuzzy.utils import full_process
+
+    grams: Set[str] = set()
+    for token in set(full_process(str(name), force_ascii=False).split()):
+        token = f" {token} "
+        grams.update(token[i : i + n] for i in range(max(len(token) - n + 1, 1)))
+    return grams
+
+
+class BlockingIndex:
+    """
+    Inverted index of character n-grams of name tokens.
+
+    Two names are candidates if the share of common n-grams in the
+    smaller n-gram set (overlap coefficient) is at least
+    ``min_overlap``. N-grams are taken from the tokens, so the token
+    order does not matter, as for token sort and set ratios.
+
+    N-grams of more than ``max_df`` share of names (and more than 100
+    names), e.g. of legal forms and words like "industries", are not
+    indexed and not counted: otherwise they make most names candidates
+    of each other. See `blocking_report` for recall of the defaults.
+
+    Args:
+        ngram: Length of n-grams.
+        min_overlap: Min overlap coefficient of candidates.
+        max_df: Max share of names an n-gram can appear in, None to
+         index all n-grams.
+        chunk_size: Number of names processed at once.
+
+    Attributes:
+        names: Indexed names.
+
+    Methods:
+        fit: Index names.
+        query: Get candidates of new names.
+        iter_pairs: Iterate over candidate pairs of indexed names.
+        candidate_pairs: Get all candidate pairs of indexed names.
+
+    Examples:
+        >>> from cmnsim.blocking import BlockingIndex
+        >>> index = BlockingIndex().fit(["Big Pharma", "Pharma Big LLC", "Roga"])
+        >>> index.candidate_pairs()
+        array([[0, 1]])
+    """
+
+    def __init__(self, ngram=4, min_overlap=0.3, max_df=0.01, chunk_size=10000):
+        self.ngram = ngram
+        self.min_overlap = min_overlap
+        self.max_df = max_df
+        self.chunk_size = chunk_size
+
+        self.names: List[str] = []
+        self._vocabulary: Dict[str, int] = {}
+        self._matrix = None
+        self._sizes = np.empty(0, dtype=np.int_)
+
+    def _vectorize(self, names, grow=False):
+        """Get binary n-gram matrix and n-gram set sizes of names."""
+
+        from scipy import sparse
+
+        indices: List[int] = []
+        indptr = [0]
+
+        for name in names:
+            for gram in _ngrams(name, self.ngram):
+                column = self._vocabulary.get(gram)
+                if column is None and grow:
+                    column = self._vocabulary[gram] = len(self._vocabulary)
+                if column is not None:
+                    indices.append(column)
+            indptr.append(len(indices))
+
+        matrix = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.int32), indices, indptr),
+            shape=(len(indptr) - 1, len(self._vocabulary)),
+        )
+        return matrix, np.diff(indptr).astype(np.int_)
+
+    def fit(self, names):
+        """
+        Index names.
+
+        Args:
+            names: Iterable of names.
+
+        Returns:
+            self
+        """
+
+        self.names = [str(name) for name in names]
+        self._vocabulary = {}
+
+        matrix, self._sizes = self._vectorize(self.names, grow=True)
+
+        if self.max_df is not None:
+            df = np.asarray(matrix.sum(axis=0)).ravel()
+            kept = np.flatnonzero(
+                df <= max(self.max_df * len(self.names), _MIN_FREQUENT_DF)
+            )
+            grams = list(self._vocabulary)
+            self._vocabulary = {grams[i]: j for j, i in enumerate(kept)}
+            matrix = matrix[:, kept].tocsr()
+            self._sizes = np.diff(matrix.indptr).astype(np.int_)
+
+        self._matrix = matrix
+        return self
+
+    def _candidates(self, matrix, sizes) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Get candidate pairs of rows of an n-gram matrix and indexed names."""
+
+        for start in range(0, matrix.shape[0], self.chunk_size):
+            shared = (matrix[start : start + self.chunk_size] @ self._matrix.T).tocoo()
+
+            smaller = np.minimum(sizes[start + shared.row], self._sizes[shared.col])
+            keep = shared.data >= self.min_overlap * np.maximum(smaller, 1)
+            yield start + shared.row[keep], shared.col[keep]
+
+    def query(self, names) -> List[np.ndarray]:
+        """
+        Get candidates of new names.
+
+        Args:
+            names: Iterable of names.
+
+        Returns:
+            List of sorted arrays of indices of indexed names, one per name.
+        """
+
+        matrix, sizes = self._vectorize([str(name) for name in names])
+        result = [np.empty(0, dtype=np.int_) for _ in range(matrix.shape[0])]
+
+        for rows, columns in self._candidates(matrix, sizes):
+            order = np.lexsort((columns, rows))
+            rows, columns = rows[order], columns[order]
+            bounds = np.flatnonzero(np.diff(rows)) + 1
+            for row, group in zip(rows[np.r_[0, bounds]], np.split(columns, bounds)):
+                if len(group):
+                    result[row] = group.astype(np.int_)
+
+        return result
+
+    def iter_pairs(self) -> Iterator[np.ndarray]:
+        """
+        Iterate over candidate pairs of indexed names.
+
+        Yields:
+            Arrays of shape (n_pairs, 2) of indices (i, j), i < j,
+            one array per ``chunk_size`` names.
+        """
+
+        for rows, columns in self._candidates(self._matrix, self._sizes):
+            keep = columns > rows
+            pairs = np.column_stack([rows[keep], columns[keep]]).astype(np.int_)
+            yield pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+    def candidate_pairs(self) -> np.ndarray:
+        """
+        Get all candidate pairs of indexed names.
+
+        Returns:
+            Array of shape (n_pairs, 2) of indices (i, j), i < j.
+        """
+
+        return np.concatenate([_empty(), *self.iter_pairs()])
+
+
+def _empty() -> np.ndarray:
+    """Empty array of pairs."""
+    return np.empty((0, 2), dtype=np.int_)
+
+
+def blocking_report(pairs, index: Optional[BlockingIndex] = None) -> Dict:
+    """
+    Measure recall of blocking on labelled pairs.
+
+    All names of the pairs are indexed, recall is the share of
+    duplicate pairs found among candidate pairs.
+
+    Args:
+        pairs: DataFrame with `name_1`, `name_2` and `is_duplicate` columns,
+         e.g. `data/1-train-balanced-3600.csv`.
+        index: Index to fit, `BlockingIndex()` by default.
+
+    Returns:
+        Dict with number of names, candidate pairs and all pairs,
+        reduction ratio, recall and share of labelled non-duplicates
+        among candidates.
+    """
+
+    index = BlockingIndex() if index is None else index
+
+    lhs = pairs["name_1"].astype(str).to_numpy()
+    rhs = pairs["name_2"].astype(str).to_numpy()
+    names = list(dict.fromkeys([*lhs, *rhs]))
+    position = {name: i for i, name in enumerate(names)}
+
+    index.fit(names)
+    found = {tuple(pair) for pair in index.candidate_pairs().tolist()}
+
+    def is_candidate(s1, s2):
+        i, j = sorted((position[s1], position[s2]))
+        return i == j or (i, j) in found
+
+    hits = np.array([is_candidate(s1, s2) for s1, s2 in zip(lhs, rhs)], dtype=bool)
+    duplicate = pairs["is_duplicate"].to_numpy() == 1
+
+    all_pairs = len(names) * (len(names) - 1) // 2
+    return {
+        "names": len(names),
+        "candidate_pairs": len(found),
+        "all_pairs": all_pairs,
+        "reduction_ratio": 1 - len(found) / all_pairs if all_pairs else 0.0,
+        "recall": hits[duplicate].mean() if duplicate.any() else 0.0,
+        "non_duplicates_kept": hits[~duplicate].mean() if (~duplicate).any() else 0.0,
+    }
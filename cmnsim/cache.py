@@ -0,0 +1,308 @@
+"""Module that contains a persistent cache for normalized company names."""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional
+
+__all__ = [
+    "NormalizationCache",
+    "pipeline_version",
+]
+
+# Max number of sqlite variables in one statement.
+_SQLITE_CHUNK = 500
+
+
+def pipeline_version(fingerprints: Iterable[str]) -> str:
+    """
+    Get version of a pipeline from fingerprints of its stages.
+
+    Args:
+        fingerprints: Fingerprints of the stages, in order.
+
+    Returns:
+        Short hex digest, which changes with the stage list.
+    """
+
+    digest = hashlib.sha1("\n".join(fingerprints).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class NormalizationCache:
+    """
+    Cache for normalized company names.
+
+    The cache has two tiers: a bounded in-memory LRU and an optional
+    sqlite file, which can be shared by the ingest script, the service
+    and the gateway crawler. Entries are keyed by pipeline version and
+    raw name, so a pipeline with another stage list never gets entries
+    of the old one.
+
+    Args:
+        maxsize: Max number of entries kept in memory.
+        path: Path to sqlite file, None for in-memory cache only.
+
+    Attributes:
+        hits: Number of lookups served from the cache.
+        disk_hits: Number of hits served from the sqlite file.
+        misses: Number of lookups not found in the cache.
+
+    Methods:
+        get: Get normalized name.
+        get_many: Get normalized names for several raw names.
+        set: Put normalized name.
+        set_many: Put several normalized names.
+        memoize: Wrap a normalization function with the cache.
+        stats: Get hit/miss counters.
+        clear: Drop all entries.
+        close: Close the sqlite file.
+
+    Examples:
+        >>> from cmnsim.cache import NormalizationCache
+        >>> cache = NormalizationCache(maxsize=2)
+        >>> cache.set("v1", "OOO Roga", "roga")
+        >>> cache.get("v1", "OOO Roga")
+        'roga'
+        >>> cache.get("v2", "OOO Roga") is None
+        True
+    """
+
+    def __init__(self, maxsize=65536, path=None):
+        self.maxsize = maxsize
+        self.path = path
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._memory: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_pid: Optional[int] = None
+
+        if path is not None:
+            self._connection()
+
+    @classmethod
+    def from_env(cls) -> "NormalizationCache":
+        """
+        Make a cache configured by environment variables.
+
+        ``CMNSIM_CACHE_PATH`` is a path to the sqlite file (memory-only
+        cache if not set), ``CMNSIM_CACHE_SIZE`` is the in-memory size.
+
+        Returns:
+            Cache instance.
+        """
+
+        return cls(
+            maxsize=int(os.getenv("CMNSIM_CACHE_SIZE", 65536)),
+            path=os.getenv("CMNSIM_CACHE_PATH") or None,
+        )
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """Get sqlite connection, reopened after fork."""
+
+        if self.path is None:
+            return None
+
+        if self._db is None or self._db_pid != os.getpid():
+            self._db = sqlite3.connect(
+                str(self.path), timeout=30, check_same_thread=False
+            )
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS normalized ("
+                " version TEXT NOT NULL,"
+                " raw TEXT NOT NULL,"
+                " normalized TEXT NOT NULL,"
+                " PRIMARY KEY (version, raw))"
+            )
+            self._db.commit()
+            self._db_pid = os.getpid()
+
+        return self._db
+
+    def _remember(self, key: tuple, value: str):
+        """Put entry into in-memory LRU."""
+
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def get(self, version: str, raw: str) -> Optional[str]:
+        """
+        Get normalized name.
+
+        Args:
+            version: Pipeline version.
+            raw: Raw name.
+
+        Returns:
+            Normalized name or None if not cached.
+        """
+
+        return self.get_many(version, [raw]).get(str(raw))
+
+    def get_many(self, version: str, raws: Iterable[str]) -> Dict[str, str]:
+        """
+        Get normalized names for several raw names.
+
+        Duplicates are looked up once.
+
+        Args:
+            version: Pipeline version.
+            raws: Raw names.
+
+        Returns:
+            Mapping from raw name to normalized name for cached names.
+        """
+
+        found: Dict[str, str] = {}
+        missing = []
+
+        with self._lock:
+            for raw in dict.fromkeys(str(x) for x in raws):
+                key = (version, raw)
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[raw] = self._memory[key]
+                else:
+                    missing.append(raw)
+
+            self.hits += len(found)
+            self.misses += len(missing)
+
+            db = self._connection()
+            if db is not None:
+                for i in range(0, len(missing), _SQLITE_CHUNK):
+                    chunk = missing[i : i + _SQLITE_CHUNK]
+                    rows = db.execute(
+                        "SELECT raw, normalized FROM normalized"
+                        " WHERE version = ?"
+                        f" AND raw IN ({', '.join('?' * len(chunk))})",
+                        [version, *chunk],
+                    ).fetchall()
+
+                    for raw, normalized in rows:
+                        found[raw] = normalized
+                        self._remember((version, raw), normalized)
+
+                    self.hits += len(rows)
+                    self.disk_hits += len(rows)
+                    self.misses -= len(rows)
+
+        return found
+
+    def set(self, version: str, raw: str, normalized: str):
+        """
+        Put normalized name.
+
+        Args:
+            version: Pipeline version.
+            raw: Raw name.
+            normalized: Normalized name.
+
+        Returns:
+            None
+        """
+
+        self.set_many(version, {raw: normalized})
+
+    def set_many(self, version: str, items: Dict[str, str]):
+        """
+        Put several normalized names.
+
+        Args:
+            version: Pipeline version.
+            items: Mapping from raw name to normalized name.
+
+        Returns:
+            None
+        """
+
+        rows = [(version, str(raw), str(value)) for raw, value in items.items()]
+
+        with self._lock:
+            for _, raw, value in rows:
+                self._remember((version, raw), value)
+
+            db = self._connection()
+            if db is not None:
+                db.executemany(
+                    "INSERT OR REPLACE INTO normalized (version, raw, normalized)"
+                    " VALUES (?, ?, ?)",
+                    rows,
+                )
+                db.commit()
+
+    def memoize(self, func: Callable[[str], str], version: str) -> Callable:
+        """
+        Wrap a normalization function with the cache.
+
+        Args:
+            func: Function from raw name to normalized name.
+            version: Version of the function output.
+
+        Returns:
+            Wrapped function.
+        """
+
+        def wrapper(raw):
+            normalized = self.get(version, raw)
+            if normalized is None:
+                normalized = func(raw)
+                self.set(version, raw, normalized)
+            return normalized
+
+        return wrapper
+
+    def stats(self) -> Dict:
+        """
+        Get hit/miss counters.
+
+        Returns:
+            Dict with counters, hit rate and in-memory size.
+        """
+
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_size": len(self._memory),
+        }
+
+    def clear(self):
+        """
+        Drop all entries and reset counters.
+
+        Returns:
+            None
+        """
+
+        with self._lock:
+            self._memory.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+            db = self._connection()
+            if db is not None:
+                db.execute("DELETE FROM normalized")
+                db.commit()
+
+    def close(self):
+        """
+        Close the sqlite file.
+
+        Returns:
+            None
+        """
+
+        if self._db is not None:
+            self._db.close()
+            self._db = None
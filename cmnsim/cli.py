@@ -1,7 +1,16 @@
 import click
 import pandas as pd
 
-from fuzzy_clf import tune_cn_fuzzy_clf
+from cmnsim.blocking import BlockingIndex, blocking_report
+from cmnsim.clustering import cluster_names
+from cmnsim.fuzzy_clf import CNFuzzyClassifier, tune_cn_fuzzy_clf
+from cmnsim.name_index import NameIndex
+from cmnsim.preprocessing import (
+    FullTransformersPipeline,
+    FusedNormalizer,
+    validate_fast_path,
+)
+from cmnsim.profiling import profile as profile_stages
 
 
 @click.group()
@@ -15,7 +24,10 @@ def cli():
 @click.option("--n-jobs", "-j", type=int, default=1)
 @click.option("--n-points-iter", "-p", type=int, default=1)
 @click.option("--save-visualization", "-s", type=bool, default=True)
-def example(dataset, n_trials, n_jobs, n_points_iter, save_visualization):
+@click.option(
+    "--parallel", type=click.Choice(["threads", "processes"]), default="threads"
+)
+def example(dataset, n_trials, n_jobs, n_points_iter, save_visualization, parallel):
     df = pd.read_csv(dataset)
     X, y = df[["name_1", "name_2"]], df["is_duplicate"]
 
@@ -26,10 +38,116 @@ def example(dataset, n_trials, n_jobs, n_points_iter, save_visualization):
         n_jobs=n_jobs,
         n_points_iter=n_points_iter,
         save_visualization=save_visualization,
+        parallel=parallel,
     )
 
 
+@cli.command()
+@click.option("--dataset", "-d", type=click.Path(exists=True), required=True)
+@click.option("--column", "-c", multiple=True, default=["name_1", "name_2"])
+@click.option("--limit", "-l", type=int, default=None)
+@click.option("--fused/--staged", default=True)
+def profile(dataset, column, limit, fused):
+    """Print time, items and bytes in/out per preprocessing stage."""
+
+    df = pd.read_csv(dataset, nrows=limit)
+    names = pd.concat([df[c] for c in column]).astype(str).values
+
+    normalizer = FusedNormalizer() if fused else FullTransformersPipeline()
+
+    with profile_stages() as profiler:
+        normalizer.transform(names)
+
+    click.echo(profiler.report())
+
+
+@cli.command(name="fast-path")
+@click.option("--dataset", "-d", type=click.Path(exists=True), required=True)
+@click.option("--column", "-c", multiple=True, default=["name_1", "name_2"])
+@click.option("--limit", "-l", type=int, default=None)
+@click.option("--max-tokens", "-t", type=int, default=3)
+def fast_path(dataset, column, limit, max_tokens):
+    """Compare normalization with and without spacy fast path."""
+
+    df = pd.read_csv(dataset, nrows=limit)
+    names = pd.concat([df[c] for c in column]).astype(str).values
+
+    report = validate_fast_path(names, max_tokens=max_tokens)
+
+    click.echo(f"fast path: {report['fast']} ({report['fast_rate']:.1%})")
+    click.echo(f"spacy: {report['ner']}")
+    click.echo(
+        f"differ from full mode: {report['differ']} ({report['differ_rate']:.1%})"
+    )
+    for name, full, fast in report["examples"]:
+        click.echo(f"  {name!r}: {full!r} != {fast!r}")
+
+
+@cli.command()
+@click.option("--dataset", "-d", type=click.Path(exists=True), required=True)
+@click.option("--ngram", "-n", type=int, default=4)
+@click.option("--min-overlap", "-o", type=float, default=0.3)
+@click.option("--max-df", "-m", type=float, default=0.01)
+def blocking(dataset, ngram, min_overlap, max_df):
+    """Print recall of candidate blocking on labelled pairs."""
+
+    df = pd.read_csv(dataset)
+    report = blocking_report(
+        df, BlockingIndex(ngram=ngram, min_overlap=min_overlap, max_df=max_df)
+    )
+
+    click.echo(f"names: {report['names']}")
+    click.echo(
+        f"candidate pairs: {report['candidate_pairs']} of {report['all_pairs']}"
+        f" (reduction ratio {report['reduction_ratio']:.4f})"
+    )
+    click.echo(f"recall: {report['recall']:.4f}")
+    click.echo(f"non-duplicates kept: {report['non_duplicates_kept']:.4f}")
+
+
+@cli.command()
+@click.option("--input", "-i", "input_", type=click.Path(exists=True), required=True)
+@click.option("--output", "-o", type=click.Path(dir_okay=False), required=True)
+@click.option("--column", "-c", default="name")
+@click.option("--threshold", "-t", type=float, default=0.8)
+@click.option("--n-jobs", "-j", type=int, default=1)
+def cluster(input_, output, column, threshold, n_jobs):
+    """Cluster normalized names and write cluster IDs and canonical names."""
+
+    names = pd.read_csv(input_, usecols=[column])[column].astype(str).values
+    clusters = cluster_names(
+        names, clf=CNFuzzyClassifier(threshold=threshold), n_jobs=n_jobs
+    )
+
+    pd.DataFrame(
+        {
+            column: names,
+            "cluster_id": clusters.labels,
+            "canonical": clusters.canonical,
+        }
+    ).to_csv(output, index=False)
+    click.echo(f"{len(names)} names in {len(clusters)} clusters saved to {output}")
+
+
+@cli.command(name="name-index")
+@click.option("--input", "-i", "input_", type=click.Path(exists=True), required=True)
+@click.option("--output", "-o", type=click.Path(dir_okay=False), required=True)
+@click.option("--column", "-c", default="normalized_name")
+@click.option("--ngram", "-n", type=int, default=3)
+def name_index(input_, output, column, ngram):
+    """Build a local index of normalized names and save it to .npz."""
+
+    names = pd.read_csv(input_, usecols=[column])[column].astype(str).unique()
+    NameIndex(ngram=ngram).fit(names).save(output)
+    click.echo(f"{len(names)} names indexed and saved to {output}")
+
+
 cli.add_command(example)
+cli.add_command(profile)
+cli.add_command(fast_path)
+cli.add_command(blocking)
+cli.add_command(cluster)
+cli.add_command(name_index)
 
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,356 @@
+"""
+Module that contains clustering of company names.
+
+Candidate pairs come from `cmnsim.blocking.BlockingIndex`, they are
+verified by `CNFuzzyClassifier` in chunks (optionally in worker
+processes) and merged with union-find. Besides the unique names, only
+the index, the union-find arrays and a few chunks of pairs per worker
+are kept in memory.
+"""
+
+import os
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List
+
+import numpy as np
+
+from cmnsim.blocking import BlockingIndex
+from cmnsim.fuzzy_clf import CNFuzzyClassifier, _scaled_mean
+from cmnsim.scoring import score_pairs
+from cmnsim.streaming import normalize_stream
+
+__all__ = [
+    "Clusters",
+    "UnionFind",
+    "cluster_names",
+    "cluster_stream",
+]
+
+
+class UnionFind:
+    """
+    Disjoint sets of integers ``0..n-1``.
+
+    Args:
+        n: Number of elements.
+
+    Methods:
+        find: Get root of the set of an element.
+        union: Merge sets of two elements.
+        union_pairs: Merge sets of pairs of elements.
+        roots: Get roots of all elements.
+
+    Examples:
+        >>> from cmnsim.clustering import UnionFind
+        >>> sets = UnionFind(4)
+        >>> sets.union_pairs([[0, 1], [1, 2]])
+        >>> sets.roots().tolist()
+        [0, 0, 0, 3]
+    """
+
+    def __init__(self, n: int):
+        self._parent = list(range(n))
+        self._size = [1] * n
+
+    def find(self, x: int) -> int:
+        """
+        Get root of the set of an element.
+
+        Args:
+            x: Element.
+
+        Returns:
+            Root element.
+        """
+
+        parent = self._parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, x: int, y: int):
+        """
+        Merge sets of two elements.
+
+        Args:
+            x: First element.
+            y: Second element.
+
+        Returns:
+            None
+        """
+
+        x, y = self.find(x), self.find(y)
+        if x == y:
+            return
+
+        if self._size[x] < self._size[y] or (self._size[x] == self._size[y] and y < x):
+            x, y = y, x
+
+        self._parent[y] = x
+        self._size[x] += self._size[y]
+
+    def union_pairs(self, pairs):
+        """
+        Merge sets of pairs of elements.
+
+        Args:
+            pairs: Array-like of shape (n_pairs, 2).
+
+        Returns:
+            None
+        """
+
+        for x, y in np.asarray(pairs, dtype=np.int_).reshape(-1, 2).tolist():
+            self.union(x, y)
+
+    def roots(self) -> np.ndarray:
+        """
+        Get roots of all elements.
+
+        Returns:
+            Array of roots.
+        """
+
+        return np.array([self.find(x) for x in range(len(self._parent))], dtype=np.int_)
+
+
+@dataclass
+class Clusters:
+    """
+    Clusters of names.
+
+    Attributes:
+        labels: Cluster ID of each input name, IDs are numbered in order
+         of the first name of a cluster.
+        representatives: Canonical name of each cluster.
+    """
+
+    labels: np.ndarray
+    representatives: np.ndarray
+
+    @property
+    def canonical(self) -> np.ndarray:
+        """Canonical name of each input name."""
+        return self.representatives[self.labels]
+
+    def __len__(self):
+        return len(self.representatives)
+
+
+def _verify(clf, names: np.ndarray, pairs: np.ndarray) -> np.ndarray:
+    """Get pairs, which the classifier takes for duplicates."""
+
+    if not len(pairs):
+        return pairs
+
+    features = score_pairs(names[pairs], backend=clf.backend)
+    scores = _scaled_mean(features * clf._weights(), *clf._bounds())
+    return pairs[scores > clf.threshold]
+
+
+_worker_state = None
+
+
+def _init_worker(clf, names):
+    """Set up a pool worker: keep the classifier and the names."""
+
+    global _worker_state
+    _worker_state = clf, names
+
+
+def _worker_verify(pairs):
+    """Verify a chunk of pairs in a pool worker."""
+    return _verify(*_worker_state, pairs)
+
+
+def _imap_bounded(pool, fn, iterable, window: int) -> Iterator:
+    """
+    Map a function over an iterable in a pool, lazily.
+
+    At most ``window`` items are submitted and not yet collected, so
+    the iterable is consumed only as fast as the pool processes it.
+
+    Args:
+        pool: `concurrent.futures.Executor`.
+        fn: Function of an item.
+        iterable: Items, e.g. a generator.
+        window: Max number of items in flight.
+
+    Yields:
+        Results, in order of completion.
+    """
+
+    pending: set = set()
+    for item in iterable:
+        if len(pending) >= window:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+        pending.add(pool.submit(fn, item))
+
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield future.result()
+
+
+def _canonical(members: List[int], counts: np.ndarray, degree: np.ndarray) -> int:
+    """
+    Choose the canonical member of a cluster.
+
+    The most frequent name, then the one matched to most other names,
+    then the first one.
+    """
+
+    return min(members, key=lambda i: (-counts[i], -degree[i], i))
+
+
+def cluster_names(
+    names: Iterable[str],
+    clf=None,
+    index=None,
+    n_jobs=1,
+) -> Clusters:
+    """
+    Cluster names.
+
+    Pairs of candidates from the blocking index are verified with the
+    classifier: a pair is merged if its score is above the threshold.
+    The score of a pair does not depend on other pairs, it is the
+    calibrated probability for calibrated classifiers (see
+    `CNFuzzyClassifier.fit`) and the score of `CNFuzzyClassifier.match`
+    otherwise. Clusters are connected components of merged pairs.
+
+    Equal names are clustered once. Pairs are generated and verified
+    in chunks of ``index.chunk_size`` names, at most two chunks per
+    worker are in flight.
+
+    Args:
+        names: Iterable of normalized names, e.g. chunks from
+         `cmnsim.streaming.normalize_stream` chained together.
+        clf: `CNFuzzyClassifier`, the default one if None.
+        index: Unfitted `BlockingIndex`, the default one if None.
+        n_jobs: Number of processes to verify pairs, -1 for all CPUs.
+
+    Returns:
+        Clusters of the names.
+
+    Examples:
+        >>> from cmnsim.clustering import cluster_names
+        >>> from cmnsim.fuzzy_clf import CNFuzzyClassifier
+        >>> clusters = cluster_names(
+        ...     ["big pharma", "roga", "pharma big", "big pharma"],
+        ...     clf=CNFuzzyClassifier(threshold=0.6),
+        ... )
+        >>> clusters.labels.tolist(), clusters.representatives.tolist()
+        ([0, 1, 0, 0], ['big pharma', 'roga'])
+    """
+
+    unique, inverse, counts = np.unique(
+        np.array([str(x) for x in names], dtype=object),
+        return_inverse=True,
+        return_counts=True,
+    )
+    return _cluster_unique(unique, inverse, counts, clf, index, n_jobs)
+
+
+def _cluster_unique(unique, inverse, counts, clf, index, n_jobs) -> Clusters:
+    """Cluster sorted unique names, see `cluster_names`."""
+
+    clf = CNFuzzyClassifier() if clf is None else clf
+    index = BlockingIndex() if index is None else index
+    index.fit(unique)
+
+    sets = UnionFind(len(unique))
+    degree = np.zeros(len(unique), dtype=np.int_)
+
+    def merge(pairs):
+        sets.union_pairs(pairs)
+        degree[:] += np.bincount(pairs.ravel(), minlength=len(unique))
+
+    n_jobs = (os.cpu_count() or 1) if n_jobs == -1 else n_jobs
+    if n_jobs <= 1:
+        for pairs in index.iter_pairs():
+            merge(_verify(clf, unique, pairs))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=n_jobs, initializer=_init_worker, initargs=(clf, unique)
+        ) as pool:
+            for pairs in _imap_bounded(
+                pool, _worker_verify, index.iter_pairs(), window=2 * n_jobs
+            ):
+                merge(pairs)
+
+    return _clusters(sets.roots(), inverse, counts, degree, unique)
+
+
+def _clusters(roots, inverse, counts, degree, unique) -> Clusters:
+    """Number clusters and choose their canonical names."""
+
+    # number clusters in order of the first input name
+    _, first = np.unique(inverse, return_index=True)
+    root_order = roots[inverse[np.sort(first)]]
+    ids: Dict[int, int] = {}
+    for root in root_order.tolist():
+        ids.setdefault(root, len(ids))
+
+    members: List[List[int]] = [[] for _ in ids]
+    for i, root in enumerate(roots.tolist()):
+        members[ids[root]].append(i)
+
+    representatives = np.array(
+        [unique[_canonical(group, counts, degree)] for group in members], dtype=object
+    )
+    labels = np.array([ids[root] for root in roots[inverse].tolist()], dtype=np.int_)
+    return Clusters(labels=labels, representatives=representatives)
+
+
+def cluster_stream(
+    source,
+    clf=None,
+    index=None,
+    n_jobs=1,
+    normalizer=None,
+    **read_params,
+) -> Clusters:
+    """
+    Normalize and cluster names from an iterable or CSV.
+
+    Names are read and normalized in chunks, see
+    `cmnsim.streaming.normalize_stream`. Only unique names and the ID
+    of each input name are kept, so memory grows with the number of
+    unique names rather than with the input. None names (e.g. from a
+    custom normalizer) are skipped.
+
+    Args:
+        source: Iterable of names, path to CSV file or file object.
+        clf: `CNFuzzyClassifier`, the default one if None.
+        index: Unfitted `BlockingIndex`, the default one if None.
+        n_jobs: Number of processes to verify pairs.
+        normalizer: Transformer of chunks, `FusedNormalizer()` by default.
+        **read_params: Parameters of `cmnsim.streaming.read_names`.
+
+    Returns:
+        Clusters of the normalized names.
+    """
+
+    ids: Dict[str, int] = {}
+    # IDs of input names, numbered in order of first appearance
+    seen = array("q")
+    for chunk in normalize_stream(source, normalizer, **read_params):
+        names: List[str] = [str(x) for x in chunk.tolist() if x is not None]
+        seen.extend(ids.setdefault(name, len(ids)) for name in names)
+
+    # renumber names in sorted order, as `np.unique` in `cluster_names`
+    names_seen = np.array(list(ids), dtype=object)
+    order = np.argsort(names_seen, kind="stable")
+    rank = np.empty(len(order), dtype=np.int_)
+    rank[order] = np.arange(len(order))
+
+    inverse = rank[np.frombuffer(seen, dtype=np.int64)]
+    counts = np.bincount(inverse, minlength=len(order))
+    return _cluster_unique(names_seen[order], inverse, counts, clf, index, n_jobs)
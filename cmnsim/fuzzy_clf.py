@@ -1,3 +1,4 @@
+import hashlib
 from pathlib import Path
 
 import numpy as np
@@ -7,35 +8,32 @@ from feijoa.visualization.evaluations import plot_evaluations
 from feijoa.visualization.hist import plot_objective_hist
 from feijoa.visualization.optimization_history import plot_optimization_history
 from feijoa.visualization.parallel_coordinates import plot_parallel_coordinates
-from fuzzywuzzy import fuzz
 from sklearn.base import BaseEstimator, ClassifierMixin
-from sklearn.model_selection import cross_val_score
+from sklearn.model_selection import StratifiedKFold
+from sklearn.utils.validation import check_is_fitted
 
+# feature extraction layer, tokens are shared by all features and pairs,
+# `_subs_ratio` is kept for code which imported it from here
+from cmnsim.scoring import FEATURE_MAX, FEATURES, feature_columns, score_pairs
+from cmnsim.scoring import subs_ratio as _subs_ratio
 
-def _subs_ratio(s1: str, s2: str) -> float:
-    """
-    Calculate the ratio of the number of words in common between two strings
-
-    Args:
-        s1: First string.
-        s2: Second string.
+# Stages of `CNFuzzyClassifier.match`, from the cheapest features
+# to the most expensive ones.
+_MATCH_STAGES = (
+    ("ratio", "token_sort_ratio", "subs_ratio"),
+    ("token_set_ratio",),
+    ("partial_ratio",),
+)
 
-    Returns:
-        The ratio of the number of words in common between two strings.
-    """
+# Slack of score upper bounds for floating point errors.
+_EPSILON = 1e-9
 
-    split_s1 = s1.split()
-    split_s2 = s2.split()
-    s1ins2 = [s1i in split_s2 for s1i in split_s1]
-    s2ins1 = [s2i in split_s1 for s2i in split_s2]
-    return (sum(s1ins2) + sum(s2ins1)) / (len(split_s1) + len(split_s2))
 
+def _scaled_mean(pred, low, high):
+    """Scale weighted features to [0, 1] by bounds and average them."""
 
-fuzz_ratio = np.vectorize(fuzz.ratio)
-fuzz_partial_ratio = np.vectorize(fuzz.partial_ratio)
-fuzz_token_sort_ratio = np.vectorize(fuzz.token_sort_ratio)
-fuzz_token_set_ratio = np.vectorize(fuzz.token_set_ratio)
-subs_ratio = np.vectorize(_subs_ratio)
+    pred = (pred - low) / (high - low)
+    return pred.mean(axis=1)
 
 
 # noinspection PyPep8Naming
@@ -48,6 +46,10 @@ class CNFuzzyClassifier(BaseEstimator, ClassifierMixin):
         w_pred_token_sort_ratio=0.2,
         w_pred_token_set_ratio=0.2,
         w_pred_subs_ratio=0.2,
+        backend="auto",
+        n_jobs=1,
+        calibrate=False,
+        cascade=False,
     ):
 
         self.threshold = threshold
@@ -58,39 +60,91 @@ class CNFuzzyClassifier(BaseEstimator, ClassifierMixin):
         self.w_pred_token_set_ratio = w_pred_token_set_ratio
         self.w_pred_subs_ratio = w_pred_subs_ratio
 
+        self.backend = backend
+        self.n_jobs = n_jobs
+        self.calibrate = calibrate
+        self.cascade = cascade
+
     def fit(self, X, y):
-        ...
+        """
+        Fit the classifier.
 
-    def _predict(self, X):
-        assert X.shape[1] == 2
+        Without calibration there is nothing to fit: probabilities are
+        weighted features scaled by min and max of the predicted batch.
+        With ``calibrate=True`` the min and max of weighted features of
+        `X` are stored, so probability of a pair does not depend on the
+        batch and predictions can be made in chunks or shards.
 
-        X = transform_to_numpy(X)
+        Args:
+            X: Array-like of shape (n_samples, 2) containing the training data.
+            y: Array-like of shape (n_samples,), not used.
 
-        lhs, rhs = X[:, 0], X[:, 1]
+        Returns:
+            self
+        """
 
-        pred_ratio = fuzz_ratio(lhs, rhs) * self.w_pred_ratio
-        pred_partial_ratio = fuzz_partial_ratio(lhs, rhs) * self.w_pred_partial_ratio
-        pred_token_sort_ratio = (
-            fuzz_token_sort_ratio(lhs, rhs) * self.w_pred_token_sort_ratio
-        )
-        pred_token_set_ratio = (
-            fuzz_token_set_ratio(lhs, rhs) * self.w_pred_token_set_ratio
-        )
-        pred_subs_ratio = subs_ratio(lhs, rhs) * self.w_pred_subs_ratio
+        if self.calibrate:
+            self._fit_features(
+                score_pairs(
+                    transform_to_numpy(X), backend=self.backend, n_jobs=self.n_jobs
+                )
+            )
+        return self
 
-        pred = np.array(
+    def _fit_features(self, features):
+        """Store min and max of weighted features of the training pairs."""
+
+        pred = features * self._weights()
+        self.feature_min_ = float(np.min(pred))
+        self.feature_max_ = float(np.max(pred))
+        return self
+
+    def _weights(self):
+        """Weights of the features, in `cmnsim.scoring.FEATURES` order."""
+
+        return np.array(
             [
-                pred_ratio,
-                pred_partial_ratio,
-                pred_token_sort_ratio,
-                pred_subs_ratio,
-                pred_token_set_ratio,
+                self.w_pred_ratio,
+                self.w_pred_partial_ratio,
+                self.w_pred_token_sort_ratio,
+                self.w_pred_subs_ratio,
+                self.w_pred_token_set_ratio,
             ],
             dtype=np.float_,
-        ).T
+        )
+
+    def _bounds(self):
+        """
+        Min and max of weighted features, which don't depend on the data.
+
+        The calibrated ones if the classifier is calibrated, otherwise
+        the bounds of the features: `predict_proba` scales weighted
+        features of a batch by their min and max, `match` scores pairs
+        one by one and can't do that.
+        """
 
-        pred = (pred - np.min(pred)) / (np.max(pred) - np.min(pred))
-        return pred.mean(axis=1)
+        if self.calibrate:
+            check_is_fitted(self, ["feature_min_", "feature_max_"])
+            return self.feature_min_, self.feature_max_
+
+        return 0.0, float(np.max(self._weights() * FEATURE_MAX))
+
+    def _predict(self, X):
+        X = transform_to_numpy(X)
+
+        assert X.shape[1] == 2
+
+        return self._predict_features(
+            score_pairs(X, backend=self.backend, n_jobs=self.n_jobs)
+        )
+
+    def _predict_features(self, features):
+        """Predict probabilities from the feature matrix of pairs."""
+
+        pred = features * self._weights()
+        if self.calibrate:
+            return _scaled_mean(pred, *self._bounds())
+        return _scaled_mean(pred, np.min(pred), np.max(pred))
 
     def predict(self, X):
         """
@@ -103,9 +157,81 @@ class CNFuzzyClassifier(BaseEstimator, ClassifierMixin):
             Class of each sample.
         """
 
+        if self.cascade:
+            return self._predict_cascade(X)
+
         pred = self.predict_proba(X) > self.threshold
         return pred.astype(np.int_)
 
+    def _predict_cascade(self, X):
+        """
+        Predict classes computing features from the cheapest ones.
+
+        After each stage of `_MATCH_STAGES` pairs, whose probability is
+        above the threshold whatever the remaining features are, or
+        can't get above it, exit early. The rest get all features and
+        the same probability as in `predict_proba`, so the classes are
+        the same as without the cascade. Stats of the last call are
+        stored in ``cascade_stats_``.
+        """
+
+        if not self.calibrate:
+            raise ValueError(
+                "Cascade prediction needs a calibrated classifier,"
+                " use CNFuzzyClassifier(calibrate=True, cascade=True).fit(X, y)"
+            )
+
+        X = transform_to_numpy(X)
+
+        assert X.shape[1] == 2
+
+        weights = self._weights()
+        maxima = weights * FEATURE_MAX
+        columns = {feature: i for i, feature in enumerate(FEATURES)}
+        low, high = self._bounds()
+        offset, scale = len(FEATURES) * low, len(FEATURES) * (high - low)
+
+        # range of the sum of weighted features not computed yet
+        rest_min = np.minimum(maxima, 0).sum()
+        rest_max = np.maximum(maxima, 0).sum()
+
+        pred = np.zeros((len(X), len(FEATURES)), dtype=np.float_)
+        labels = np.zeros(len(X), dtype=np.int_)
+        index = np.arange(len(X))
+        exits = []
+
+        for stage in _MATCH_STAGES:
+            stage_columns = [columns[feature] for feature in stage]
+            pred[np.ix_(index, stage_columns)] = (
+                score_pairs(
+                    X[index], backend=self.backend, n_jobs=self.n_jobs, features=stage
+                )
+                * weights[stage_columns]
+            )
+            if stage is _MATCH_STAGES[-1]:
+                break
+
+            rest_min -= np.minimum(maxima[stage_columns], 0).sum()
+            rest_max -= np.maximum(maxima[stage_columns], 0).sum()
+
+            known = pred[index].sum(axis=1)
+            positive = (known + rest_min - offset) / scale - _EPSILON > self.threshold
+            negative = (known + rest_max - offset) / scale + _EPSILON <= self.threshold
+
+            labels[index[positive]] = 1
+            exits.append(int(positive.sum() + negative.sum()))
+            index = index[~(positive | negative)]
+
+        proba = _scaled_mean(pred[index], low, high)
+        labels[index] = proba > self.threshold
+
+        self.cascade_stats_ = {
+            "pairs": len(X),
+            "stage_exits": exits,
+            "early_exit_rate": sum(exits) / len(X) if len(X) else 0.0,
+        }
+        return labels
+
     def predict_proba(self, X):
         """
         Predict the probability of each class.
@@ -119,6 +245,139 @@ class CNFuzzyClassifier(BaseEstimator, ClassifierMixin):
 
         return self._predict(X)
 
+    def iter_predict_proba(self, X, chunk_size=10000):
+        """
+        Predict probabilities of pairs in fixed-size chunks.
+
+        Only one chunk of pairs is kept in memory at a time. Needs a
+        calibrated classifier, otherwise probabilities would depend on
+        the chunks.
+
+        Args:
+            X: Iterable of pairs of names, e.g. a generator.
+            chunk_size: Number of pairs in a chunk.
+
+        Yields:
+            Arrays of probabilities, in order.
+        """
+
+        from cmnsim.streaming import iter_chunks
+
+        if not self.calibrate:
+            raise ValueError(
+                "Chunked prediction needs a calibrated classifier,"
+                " use CNFuzzyClassifier(calibrate=True).fit(X, y)"
+            )
+
+        for chunk in iter_chunks(X, chunk_size):
+            yield self.predict_proba(np.array(chunk, dtype=object).reshape(-1, 2))
+
+    def match(self, query, candidates, k=5, cutoff=None):
+        """
+        Find the nearest candidates to a query name.
+
+        See `match_many`.
+
+        Args:
+            query: Query name.
+            candidates: Sequence of candidate names.
+            k: Max number of matches.
+            cutoff: Min score of a match, the threshold by default.
+
+        Returns:
+            List of (candidate, score, index) tuples, best first.
+        """
+
+        return self.match_many([query], candidates, k=k, cutoff=cutoff)[0]
+
+    def match_many(self, queries, candidates, k=5, cutoff=None):
+        """
+        Find the nearest candidates to each query name.
+
+        Scores are weighted features scaled by their bounds (not by
+        min and max of a batch as in `predict_proba`), so the score of
+        a pair does not depend on other candidates. Features are
+        computed in stages from the cheapest to the most expensive
+        ones, after each stage candidates, whose best possible score
+        can't exceed the cutoff or is below the k-th best score so far,
+        are dropped. The result is the same as of scoring all pairs.
+
+        A match must score above the cutoff, as a pair must score above
+        the threshold to be predicted a duplicate.
+
+        Args:
+            queries: Sequence of query names.
+            candidates: Sequence of candidate names.
+            k: Max number of matches per query.
+            cutoff: Score a match must exceed, the threshold by default,
+             ``-np.inf`` to get top-k candidates anyway.
+
+        Returns:
+            List of lists of (candidate, score, index) tuples, best first.
+
+        Examples:
+            >>> from cmnsim.fuzzy_clf import CNFuzzyClassifier
+            >>> clf = CNFuzzyClassifier()
+            >>> clf.match("big pharma", ["pharma big", "roga"], k=1, cutoff=0)
+            [('pharma big', 0.642, 0)]
+        """
+
+        cutoff = self.threshold if cutoff is None else cutoff
+        candidates = np.array([str(x) for x in candidates], dtype=object)
+
+        weights = self._weights()
+        maxima = weights * FEATURE_MAX
+        columns = {feature: i for i, feature in enumerate(FEATURES)}
+        low, high = self._bounds()
+        offset, scale = len(FEATURES) * low, len(FEATURES) * (high - low)
+
+        matches = []
+        for query in queries:
+            index = np.arange(len(candidates))
+            pred = np.zeros((len(candidates), len(FEATURES)), dtype=np.float_)
+            # bounds of the weighted features not computed yet
+            rest_min = np.minimum(maxima, 0).sum()
+            rest_max = np.maximum(maxima, 0).sum()
+
+            for stage in _MATCH_STAGES:
+                if not len(index) or k < 1:
+                    break
+
+                stage_columns = [columns[feature] for feature in stage]
+                pred[np.ix_(index, stage_columns)] = (
+                    feature_columns(
+                        [query] * len(index),
+                        candidates[index],
+                        stage,
+                        backend=self.backend,
+                    )
+                    * weights[stage_columns]
+                )
+                rest_min -= np.minimum(maxima[stage_columns], 0).sum()
+                rest_max -= np.maximum(maxima[stage_columns], 0).sum()
+
+                known = pred[index].sum(axis=1)
+                lower = (known + rest_min - offset) / scale
+                upper = (known + rest_max - offset) / scale + _EPSILON
+
+                keep = upper > cutoff
+                if len(index) > k:
+                    keep &= upper >= np.partition(lower, -k)[-k] - _EPSILON
+
+                index = index[keep]
+
+            scores = _scaled_mean(pred[index], low, high)
+            order = np.lexsort((index, -scores))
+            matches.append(
+                [
+                    (candidates[i], float(score), int(i))
+                    for i, score in zip(index[order], scores[order])
+                    if score > cutoff
+                ][: max(k, 0)]
+            )
+
+        return matches
+
 
 # noinspection PyPep8Naming
 def transform_to_numpy(X):
@@ -164,6 +423,115 @@ def _get_last_tuning_number():
     return int(last_session[-1].stem[-1]) if last_session else 0
 
 
+def _data_digest(X) -> str:
+    """Get digest of pairs of names."""
+
+    digest = hashlib.sha1()
+    for s1, s2 in X:
+        digest.update(f"{s1}\x1f{s2}\x1e".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def _tuning_features(X, session_folder: Path, n_jobs=1) -> np.ndarray:
+    """
+    Get the feature matrix of pairs, cached on disk.
+
+    The matrix is saved next to ``tuning.db`` of the session and reused
+    by later sessions on the same data.
+
+    Args:
+        X: Array of shape (n_samples, 2) with pairs of names.
+        session_folder: Folder of the tuning session.
+        n_jobs: Number of processes to compute the features.
+
+    Returns:
+        Float array of shape (n_samples, 5).
+    """
+
+    name = f"features_{_data_digest(X)}.npy"
+
+    for cached in sorted(session_folder.parent.glob(f"tuning_*/{name}")):
+        return np.load(cached)
+
+    features = score_pairs(X, n_jobs=n_jobs)
+    np.save(session_folder.joinpath(name), features)
+    return features
+
+
+def _cross_val_accuracy(clf, features, y, folds) -> float:
+    """
+    Same as ``cross_val_score(clf, X, y, cv=folds).mean()``.
+
+    Each test fold is predicted from its rows of the precomputed feature
+    matrix. `CNFuzzyClassifier.fit` only calibrates min and max of
+    weighted features, for calibrated classifiers they are taken from
+    the other (training) folds.
+    """
+
+    weighted = [features[test] * clf._weights() for test in folds]
+    minima = np.array([np.min(pred) for pred in weighted])
+    maxima = np.array([np.max(pred) for pred in weighted])
+
+    scores = []
+    for i, (pred, test) in enumerate(zip(weighted, folds)):
+        if clf.calibrate:
+            train = np.arange(len(folds)) != i
+            low, high = minima[train].min(), maxima[train].max()
+        else:
+            low, high = minima[i], maxima[i]
+
+        scores.append(
+            np.mean((_scaled_mean(pred, low, high) > clf.threshold) == y[test])
+        )
+
+    return float(np.mean(scores))
+
+
+class _CrossValObjective:
+    """
+    Objective of tuning trials over cross-validation folds.
+
+    Features and labels are read from ``.npy`` files sorted by fold, so
+    each fold is a slice of a memory map. Only the paths are pickled, so
+    worker processes share the data through the page cache instead of
+    getting copies of it.
+
+    Args:
+        session_folder: Folder of the tuning session.
+        features: Float array of shape (n_samples, 5).
+        y: Labels.
+        folds: Test indices of the folds.
+        calibrate: Whether to tune a calibrated classifier.
+    """
+
+    def __init__(self, session_folder: Path, features, y, folds, calibrate=False):
+        order = np.concatenate(folds)
+        offsets = np.cumsum([0, *(len(test) for test in folds)])
+
+        self.features_path = session_folder.joinpath("cv_features.npy")
+        self.labels_path = session_folder.joinpath("cv_labels.npy")
+        self.folds = [slice(a, b) for a, b in zip(offsets[:-1], offsets[1:])]
+        self.calibrate = calibrate
+
+        np.save(self.features_path, np.asarray(features)[order])
+        np.save(self.labels_path, np.asarray(y)[order])
+
+        self._features = self._labels = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_features"] = state["_labels"] = None
+        return state
+
+    def __call__(self, experiment):
+        if self._features is None:
+            self._features = np.load(self.features_path, mmap_mode="r")
+            self._labels = np.load(self.labels_path, mmap_mode="r")
+
+        clf = CNFuzzyClassifier(**experiment.params, calibrate=self.calibrate)
+        return 1 - _cross_val_accuracy(clf, self._features, self._labels, self.folds)
+
+
 def tune_cn_fuzzy_clf(
     X,
     y,
@@ -171,10 +539,17 @@ def tune_cn_fuzzy_clf(
     n_jobs=1,
     n_points_iter=1,
     save_visualization=True,
+    parallel="threads",
+    calibrate=False,
 ):
     """
     Tune the weights of the company names fuzzy classifier.
 
+    Features of the pairs are computed once and cached next to
+    ``tuning.db``, trials only reweight them. With
+    ``parallel="processes"`` trials run in ``n_jobs`` worker processes,
+    which read the features from a shared memory map.
+
     Args:
         X: Array-like of shape (n_samples, 2) containing the data to predict.
         y: Array-like of shape (n_samples,) containing the true class of each sample.
@@ -182,14 +557,21 @@ def tune_cn_fuzzy_clf(
         n_jobs: Number of jobs to run in parallel.
         n_points_iter: Number of points to evaluate in each iteration.
         save_visualization: Whether to save the visualization.
+        parallel: Run parallel trials in "threads" or "processes".
+        calibrate: Whether to tune a calibrated classifier, its min and
+         max of weighted features are fitted on the whole dataset.
 
     Returns:
         A dictionary containing the weights of the fuzzy classifier.
     """
 
+    import joblib
     from feijoa import Real, SearchSpace, create_job
     from pymoo.config import Config
 
+    if parallel not in ("threads", "processes"):
+        raise ValueError(f"parallel must be 'threads' or 'processes', not {parallel!r}")
+
     # ignore pymoo warnings
     Config.warnings["not_compiled"] = False
 
@@ -218,19 +600,28 @@ def tune_cn_fuzzy_clf(
         storage=f"sqlite:///{tuning_folder.joinpath(name, 'tuning.db')}",
     )
 
+    X, y = transform_to_numpy(X), np.asarray(y)
+    features = _tuning_features(X, tuning_folder.joinpath(name), n_jobs=n_jobs)
+
+    # same folds as cross_val_score(cv=5) of a classifier
+    folds = [test for _, test in StratifiedKFold(n_splits=5).split(features, y)]
+
     # define the objective function
-    def objective(experiment):
-        clf = CNFuzzyClassifier(**experiment.params)
-        return 1 - cross_val_score(clf, X, y, cv=5).mean()
-
-    job.do(
-        objective,
-        n_trials=n_trials,
-        optimizer="bayesian",
-        n_jobs=n_jobs,
-        n_points_iter=n_points_iter,
+    objective = _CrossValObjective(
+        tuning_folder.joinpath(name), features, y, folds, calibrate=calibrate
     )
 
+    # feijoa prefers threads, an explicit backend overrides it
+    backend = "loky" if parallel == "processes" else "threading"
+    with joblib.parallel_backend(backend, n_jobs=n_jobs):
+        job.do(
+            objective,
+            n_trials=n_trials,
+            optimizer="bayesian",
+            n_jobs=n_jobs,
+            n_points_iter=n_points_iter,
+        )
+
     print(f"Best parameters: {job.best_parameters}")
     print(f"Best score: {1 - job.best_value}")
 
@@ -250,7 +641,8 @@ def tune_cn_fuzzy_clf(
             tuning_folder.joinpath(name, "optimization_history.html")
         )
 
-    return CNFuzzyClassifier(**job.best_parameters)
+    clf = CNFuzzyClassifier(**job.best_parameters, calibrate=calibrate)
+    return clf._fit_features(features) if calibrate else clf
 
 
 if __name__ == "__main__":
@@ -1,7 +1,6 @@
+import re
 from functools import lru_cache
 
-import spacy
-
 
 @lru_cache(None)
 def get_nlp(language):
@@ -15,6 +14,8 @@ def get_nlp(language):
         NLP object.
     """
 
+    import spacy
+
     # noinspection PyBroadException
     try:
         nlp = spacy.load(language)
@@ -26,6 +27,33 @@ def get_nlp(language):
     return nlp
 
 
+# Characters which usually separate a company name from extra text,
+# e.g. "VK mobile version | VK".
+_SEPARATORS = re.compile(r"[|:;/\\()\[\]«»\"“”—–]|\s-\s")
+
+# Components that entity recognizers may listen to, they must stay enabled.
+_SHARED_COMPONENTS = ("tok2vec", "transformer")
+
+
+def ner_disabled_components(nlp):
+    """
+    Get names of components that entity extraction does not need.
+
+    Args:
+        nlp: NLP object.
+
+    Returns:
+        List of component names, which can be disabled.
+    """
+
+    return [
+        name
+        for name in nlp.pipe_names
+        if name not in _SHARED_COMPONENTS
+        and "doc.ents" not in nlp.get_pipe_meta(name).assigns
+    ]
+
+
 def process_spacy(x: str) -> str:
     """
     Process spacy.
@@ -44,3 +72,52 @@ def process_spacy(x: str) -> str:
         return result[0].text
 
     return x
+
+
+def process_spacy_batch(texts, batch_size=256, n_process=1):
+    """
+    Process spacy in batches.
+
+    Texts are streamed through ``nlp.pipe`` with every component
+    that does not produce entities disabled. Results are the same as
+    of `process_spacy` for each text.
+
+    Args:
+        texts: Iterable of texts to process.
+        batch_size: Number of texts in a batch.
+        n_process: Number of processes, -1 for all CPUs.
+
+    Yields:
+        Normalized texts, in order.
+    """
+
+    nlp = get_nlp("xx_ent_wiki_sm")
+    docs = nlp.pipe(
+        ((str(x), x) for x in texts),
+        as_tuples=True,
+        batch_size=batch_size,
+        n_process=n_process,
+        disable=ner_disabled_components(nlp),
+    )
+
+    for doc, x in docs:
+        yield doc.ents[0].text if doc.ents else x
+
+
+def needs_ner(x: str, max_tokens: int = 3) -> bool:
+    """
+    Cheap check whether a text may need entity extraction.
+
+    Short texts without separators are usually the company name
+    itself, entity extraction returns them as is.
+
+    Args:
+        x: Text to check.
+        max_tokens: Max number of tokens of a text, which can skip NER.
+
+    Returns:
+        False if the text can skip NER.
+    """
+
+    x = str(x)
+    return len(x.split()) > max_tokens or _SEPARATORS.search(x) is not None
@@ -0,0 +1,345 @@
+"""
+Module that contains an in-process nearest-name index.
+
+Names are vectors of hashed character n-grams of their tokens weighted
+by TF-IDF, nearest names are found by cosine similarity with sparse
+matrix products and re-ranked by `CNFuzzyClassifier`. Works without
+Elasticsearch: for offline deduplication, tests, small deployments and
+as a fallback of the gateway.
+"""
+
+import zlib
+from pathlib import Path
+from typing import List, Tuple, Union
+
+import numpy as np
+
+from cmnsim.blocking import _ngrams
+
+__all__ = [
+    "NameIndex",
+]
+
+
+class NameIndex:
+    """
+    Index of names for top-k cosine lookups.
+
+    N-grams are taken from the tokens as in `BlockingIndex`, hashed into
+    ``n_features`` columns and weighted by smoothed IDF. Only binary
+    n-gram vectors are stored, weighted vectors are built on the first
+    search.
+
+    Rows of added names are kept pending: they are searched with the
+    IDF of the last rebuild and merged into the index, which is
+    reweighted on the next search, once there are more than
+    ``max_pending`` of them, so an `add` does not copy the whole index.
+    `rebuild` merges them right away, e.g. on a timer.
+
+    Args:
+        ngram: Length of n-grams.
+        n_features: Number of hash buckets.
+        n_candidates: Number of nearest names by cosine re-ranked by
+         the classifier in `query`.
+        chunk_size: Number of queries multiplied at once.
+        max_pending: Max number of added names searched with stale IDF.
+
+    Attributes:
+        names: Indexed names.
+
+    Methods:
+        fit: Index names, dropping previous ones.
+        add: Add names to the index.
+        rebuild: Merge added names and reweight the index.
+        search: Get top-k names by cosine similarity.
+        query: Get top-k names re-ranked by the classifier.
+        save: Save the index to `.npz`.
+        load: Load the index from `.npz`.
+
+    Examples:
+        >>> from cmnsim.name_index import NameIndex
+        >>> index = NameIndex().fit(["pharma big", "roga i kopyta"])
+        >>> index.add(["brenntag"]).query(["big pharma"], k=1)
+        [[('pharma big', 0.642, 0)]]
+    """
+
+    def __init__(
+        self,
+        ngram=3,
+        n_features=2**20,
+        n_candidates=50,
+        chunk_size=1000,
+        max_pending=1000,
+    ):
+        self.ngram = ngram
+        self.n_features = n_features
+        self.n_candidates = n_candidates
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending
+
+        self.names: List[str] = []
+        self._matrix = self._vectorize([])
+        self._pending: List = []
+        self._n_pending = 0
+        self._weighted = None
+        self._pending_weighted = None
+
+    def _vectorize(self, names):
+        """Get binary matrix of hashed n-grams of names."""
+
+        from scipy import sparse
+
+        indices: List[int] = []
+        indptr = [0]
+
+        for name in names:
+            columns = {
+                zlib.crc32(gram.encode("utf-8")) % self.n_features
+                for gram in _ngrams(name, self.ngram)
+            }
+            indices.extend(sorted(columns))
+            indptr.append(len(indices))
+
+        return sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.float_), indices, indptr),
+            shape=(len(indptr) - 1, self.n_features),
+        )
+
+    def _idf(self) -> np.ndarray:
+        """Smoothed IDF of hash buckets of merged rows."""
+
+        df = np.bincount(self._matrix.indices, minlength=self.n_features)
+        return np.log((1 + self._matrix.shape[0]) / (1 + df)) + 1
+
+    def _normalize(self, matrix, idf):
+        """Weight rows of a binary matrix by IDF and scale them to unit length."""
+
+        from scipy import sparse
+
+        data = idf[matrix.indices]
+        lengths = np.diff(matrix.indptr)
+        norms = np.sqrt(
+            np.bincount(
+                np.repeat(np.arange(len(lengths)), lengths), data**2, len(lengths)
+            )
+        )
+        norms[norms == 0] = 1
+        return sparse.csr_matrix(
+            (data / np.repeat(norms, lengths), matrix.indices, matrix.indptr),
+            shape=matrix.shape,
+        )
+
+    def fit(self, names):
+        """
+        Index names, dropping previous ones.
+
+        Args:
+            names: Iterable of names.
+
+        Returns:
+            self
+        """
+
+        self.names = []
+        self._matrix = self._vectorize([])
+        self._pending, self._n_pending = [], 0
+        self._weighted = self._pending_weighted = None
+        return self.add(names)
+
+    def add(self, names):
+        """
+        Add names to the index.
+
+        Only the new names are vectorized, see `NameIndex` on when
+        they are merged.
+
+        Args:
+            names: Iterable of names.
+
+        Returns:
+            self
+        """
+
+        names = [str(name) for name in names]
+        if not names:
+            return self
+
+        self.names.extend(names)
+        self._pending.append(self._vectorize(names))
+        self._n_pending += len(names)
+        self._pending_weighted = None
+
+        if self._n_pending > self.max_pending:
+            self._merge()
+        return self
+
+    def _merge(self):
+        """Append pending rows to the index, it is reweighted on the next search."""
+
+        from scipy import sparse
+
+        if self._pending:
+            self._matrix = sparse.vstack([self._matrix, *self._pending], format="csr")
+            self._pending, self._n_pending = [], 0
+            self._weighted = self._pending_weighted = None
+
+    def rebuild(self):
+        """
+        Merge added names and reweight the index.
+
+        Returns:
+            self
+        """
+
+        self._merge()
+        idf = self._idf()
+        self._weighted = self._normalize(self._matrix, idf).T.tocsr(), idf
+        return self
+
+    def _weighted_rows(self):
+        """Weighted transposed rows of the index and of pending names, and IDF."""
+
+        from scipy import sparse
+
+        if self._weighted is None:
+            self.rebuild()
+
+        weighted, idf = self._weighted
+        if self._pending_weighted is None:
+            pending = sparse.vstack([self._vectorize([]), *self._pending], format="csr")
+            self._pending_weighted = self._normalize(pending, idf).T.tocsr()
+
+        return weighted, self._pending_weighted, idf
+
+    def search(self, names, k=5) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Get top-k names by cosine similarity.
+
+        Args:
+            names: Iterable of query names.
+            k: Max number of names per query.
+
+        Returns:
+            List of (indices, similarities) array pairs, most similar
+            first, one pair per query. Names without common n-grams are
+            not returned.
+        """
+
+        from scipy import sparse
+
+        weighted, pending, idf = self._weighted_rows()
+        queries = [str(name) for name in names]
+
+        result = []
+        for start in range(0, len(queries), self.chunk_size):
+            chunk = self._normalize(
+                self._vectorize(queries[start : start + self.chunk_size]), idf
+            )
+            # columns of pending names follow the merged ones
+            similarity = sparse.hstack(
+                [chunk @ weighted, chunk @ pending], format="csr"
+            )
+
+            for row in range(similarity.shape[0]):
+                begin, end = similarity.indptr[row], similarity.indptr[row + 1]
+                columns = similarity.indices[begin:end]
+                values = similarity.data[begin:end]
+
+                # ties go to the earlier indexed name
+                order = np.lexsort((columns, -values))[:k]
+                result.append((columns[order].astype(np.int_), values[order]))
+
+        return result
+
+    def query(self, names, k=5, clf=None, cutoff=None):
+        """
+        Get top-k names re-ranked by the classifier.
+
+        ``n_candidates`` nearest names by cosine similarity are scored
+        by `CNFuzzyClassifier.match_many`, the scores do not depend on
+        other candidates.
+
+        Args:
+            names: Iterable of query names.
+            k: Max number of matches per query.
+            clf: `CNFuzzyClassifier`, the default one if None.
+            cutoff: Score a match must exceed, see
+             `CNFuzzyClassifier.match_many`, no cutoff by default.
+
+        Returns:
+            List of lists of (name, score, index) tuples, best first.
+        """
+
+        from cmnsim.fuzzy_clf import CNFuzzyClassifier
+
+        clf = CNFuzzyClassifier() if clf is None else clf
+        cutoff = -np.inf if cutoff is None else cutoff
+        queries = [str(name) for name in names]
+
+        result = []
+        for query, (indices, _) in zip(
+            queries, self.search(queries, k=max(self.n_candidates, k))
+        ):
+            candidates = [self.names[i] for i in indices]
+            matches = clf.match(query, candidates, k=k, cutoff=cutoff)
+            result.append(
+                [(name, score, int(indices[i])) for name, score, i in matches]
+            )
+
+        return result
+
+    def save(self, path: Union[str, Path]):
+        """
+        Save the index to `.npz`, pending names are merged.
+
+        Args:
+            path: File path.
+
+        Returns:
+            None
+        """
+
+        self._merge()
+        np.savez_compressed(
+            path,
+            indices=self._matrix.indices,
+            indptr=self._matrix.indptr,
+            names=np.array(self.names, dtype=str),
+            params=np.array(
+                [
+                    self.ngram,
+                    self.n_features,
+                    self.n_candidates,
+                    self.chunk_size,
+                    self.max_pending,
+                ]
+            ),
+        )
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "NameIndex":
+        """
+        Load the index from `.npz`.
+
+        Args:
+            path: File path.
+
+        Returns:
+            Loaded index.
+        """
+
+        from scipy import sparse
+
+        with np.load(path) as data:
+            index = cls(*data["params"].tolist())
+            index.names = data["names"].tolist()
+            index._matrix = sparse.csr_matrix(
+                (
+                    np.ones(len(data["indices"]), dtype=np.float_),
+                    data["indices"],
+                    data["indptr"],
+                ),
+                shape=(len(index.names), index.n_features),
+            )
+
+        return index
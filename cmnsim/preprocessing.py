@@ -1,17 +1,27 @@
-"""Module that contains functions for preprocessing data."""
+"""
+Module that contains functions for preprocessing data.
+
+Heavy dependencies (spacy, pandas, cleanco, unidecode) are imported
+when a stage is used for the first time, call `warmup` to load them
+and the spacy model ahead of time.
+"""
 
 import abc
+import os
+import re
 import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
 import numpy as np
-import pandas as pd
-from cleanco import basename
 from sklearn.base import BaseEstimator, TransformerMixin
-from sklearn.pipeline import Pipeline
 from sklearn.utils import column_or_1d
-from unidecode import unidecode
 
 import cmnsim.misc.spacy_wrapper as ner
+from cmnsim.cache import pipeline_version
+from cmnsim.profiling import profiled, profiler
 
 __all__ = [
     "Spacy",
@@ -22,6 +32,10 @@ __all__ = [
     "Unidecoder",
     "Lowercaser",
     "FullTransformersPipeline",
+    "FusedNormalizer",
+    "default_steps",
+    "validate_fast_path",
+    "warmup",
 ]
 
 _PIPELINE_ORDER = [
@@ -35,20 +49,50 @@ _PIPELINE_ORDER = [
     "Lowercaser",
 ]
 
-_basename = np.vectorize(basename)
+
+def _basename_one(x):
+    from cleanco import basename
+
+    return basename(x)
+
+
+def _unidecode_one(x):
+    from unidecode import unidecode
+
+    return unidecode(x)
+
+
+_basename = np.vectorize(_basename_one)
 _lower = np.vectorize(str.lower)
-_unidecode = np.vectorize(unidecode)
+_unidecode = np.vectorize(_unidecode_one)
 
 _nerd_vectorized = np.vectorize(ner.process_spacy)
 
+_MULTIPLE_SPACES = re.compile(r"\s\s+")
+
+
+@lru_cache(None)
+def _compile_all(patterns):
+    """Compile a tuple of regex patterns once."""
+    return tuple(re.compile(pattern) for pattern in patterns)
+
 
 class _NoFitNeededTransformer(TransformerMixin, BaseEstimator, metaclass=abc.ABCMeta):
 
     """
     A base class for transformers that don't need to be fitted.
     Need to implement the `transform` method.
+
+    Calls of `transform` of every subclass are recorded by
+    `cmnsim.profiling.profiler` when it is enabled.
     """
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        if "transform" in cls.__dict__:
+            cls.transform = profiled()(cls.transform)
+
     # noinspection PyUnusedLocal
     def fit(self, y):
         """
@@ -77,6 +121,54 @@ class _NoFitNeededTransformer(TransformerMixin, BaseEstimator, metaclass=abc.ABC
         """
         raise NotImplementedError()
 
+    @property
+    def batched(self):
+        """Whether the stage should transform whole columns at once."""
+        return False
+
+    def preload(self):
+        """
+        Load resources needed by the stage (e.g. models) ahead of time.
+
+        Transforms a sample label, so lazy imports and compiled regexes
+        are done before the first real call.
+
+        Returns:
+            None
+        """
+
+        self.transform_one("Warmup 1")
+
+    def fingerprint(self):
+        """
+        Get fingerprint of the stage.
+
+        It must change whenever the output of the stage may change,
+        it is used to version cached normalized names.
+
+        Returns:
+            Fingerprint string.
+        """
+
+        return type(self).__name__
+
+    def transform_one(self, x):
+        """
+        Transform a single label.
+
+        Must give the same result as `transform` on a one-element array,
+        it is used by `FusedNormalizer` to run stages without building
+        intermediate arrays.
+
+        Args:
+            x: Label to transform.
+
+        Returns:
+            Transformed label.
+        """
+
+        raise NotImplementedError()
+
 
 # noinspection PyMethodMayBeStatic
 class CleancoCleaner(_NoFitNeededTransformer):
@@ -97,6 +189,9 @@ class CleancoCleaner(_NoFitNeededTransformer):
         y = column_or_1d(y, warn=True)
         return _basename(y)
 
+    def transform_one(self, x):
+        return _basename_one(x)
+
 
 # noinspection PyMethodMayBeStatic,SpellCheckingInspection
 class Lowercaser(_NoFitNeededTransformer):
@@ -116,31 +211,41 @@ class Lowercaser(_NoFitNeededTransformer):
         y = column_or_1d(y, warn=True)
         return _lower(y)
 
+    def transform_one(self, x):
+        return x.lower()
+
 
 class RusStopWordsCleaner(_NoFitNeededTransformer):
     """
     A transformer that transforms labels to normalized russian company names.
+
+    Stop words are removed as whole tokens, case-insensitively. All of them
+    are compiled into one trie-shaped regex, so each label is scanned once
+    however long the list is.
+
+    Args:
+        stop_words_file: Path to a file with extra stop words, one per line,
+         lines starting with ``#`` are ignored. Defaults to
+         ``CMNSIM_STOP_WORDS_FILE`` environment variable.
+
+    Examples:
+        >>> from cmnsim.preprocessing import RusStopWordsCleaner
+        >>> cleaner = RusStopWordsCleaner()
+        >>> cleaner.transform(["ООО рога и копыта групп", "заокеанский банк"])
+        array(['рога и копыта', 'заокеанский банк'], dtype=object)
     """
 
     STOP_WORDS = [
         "ооо",
-        "OOO",
-        "OAO",
-        "AO",
-        "ЗАО",
-        "ОАО",
-        "ПАО",
-        "АО",
-        "ЗАО",
-        "ОАО",
-        "ПАО",
-        "АО",
-        "ЗАО",
-        "общество с огранниченной ответственностью",
         "оао",
+        "зао",
+        "пао",
         "ао",
+        "ooo",
+        "oao",
+        "ao",
+        "общество с огранниченной ответственностью",
         "гк",
-        "зао",
         "лтд",
         "нпф",
         "групп",
@@ -148,10 +253,102 @@ class RusStopWordsCleaner(_NoFitNeededTransformer):
         "лимитед",
     ]
 
+    def __init__(self, stop_words_file=None):
+        self.stop_words_file = stop_words_file
+
+    @property
+    def stop_words(self):
+        """Deduplicated lowercase stop words, including ones from the file."""
+
+        path = self.stop_words_file or os.getenv("CMNSIM_STOP_WORDS_FILE")
+        if getattr(self, "_stop_words_path", None) != (path,):
+            self._stop_words_cache = _unique_lower(
+                self.STOP_WORDS + (_read_stop_words(path) if path else [])
+            )
+            self._stop_words_path = (path,)
+        return self._stop_words_cache
+
+    @property
+    def _regex(self):
+        return _stop_words_regex(tuple(self.stop_words))
+
     def transform(self, y):
         """Transform labels to normalized company names."""
+        import pandas as pd
+
         y = column_or_1d(y, warn=True)
-        return pd.Series(y).replace(self.STOP_WORDS, "", regex=True).str.strip().values
+        return pd.Series(y).str.replace(self._regex, "", regex=True).str.strip().values
+
+    def fingerprint(self):
+        return "\t".join([type(self).__name__, *self.stop_words])
+
+    def transform_one(self, x):
+        return self._regex.sub("", x).strip()
+
+
+def _unique_lower(words):
+    """Lowercase words and drop duplicates, keeping order."""
+    return list(dict.fromkeys(word.lower() for word in words))
+
+
+def _read_stop_words(path):
+    """
+    Read stop words file.
+
+    Args:
+        path: Path to the file, one stop word per line.
+
+    Returns:
+        List of stop words.
+    """
+
+    with open(path, encoding="utf-8") as f:
+        lines = (line.strip() for line in f)
+        return [line for line in lines if line and not line.startswith("#")]
+
+
+def _trie_pattern(node):
+    """Make regex pattern matching all words of a trie node."""
+
+    branches = [
+        re.escape(char) + _trie_pattern(child)
+        for char, child in sorted(node.items())
+        if char
+    ]
+
+    if not branches:
+        return ""
+
+    if len(branches) == 1 and "" not in node:
+        return branches[0]
+
+    pattern = "(?:" + "|".join(branches) + ")"
+    return pattern + "?" if "" in node else pattern
+
+
+@lru_cache(None)
+def _stop_words_regex(words):
+    """
+    Compile stop words into one regex.
+
+    Words share their prefixes in a trie, so matching does not
+    slow down with the number of words. Only whole tokens are matched.
+
+    Args:
+        words: Tuple of lowercase stop words.
+
+    Returns:
+        Compiled case-insensitive regex.
+    """
+
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    return re.compile(rf"(?<!\w){_trie_pattern(trie)}(?!\w)", re.IGNORECASE)
 
 
 # noinspection PyMethodMayBeStatic
@@ -169,6 +366,8 @@ class RegexEliminator(_NoFitNeededTransformer):
 
     def transform(self, y):
         """Transform labels to lowercase."""
+        import pandas as pd
+
         y = column_or_1d(y, warn=True)
         return (
             pd.Series(y)
@@ -178,6 +377,13 @@ class RegexEliminator(_NoFitNeededTransformer):
             .values
         )
 
+    def fingerprint(self):
+        return f"{type(self).__name__}\t{self._regex}"
+
+    def transform_one(self, x):
+        [regex] = _compile_all((self._regex,))
+        return _MULTIPLE_SPACES.sub("", regex.sub(" ", x).strip())
+
 
 class NumbersEliminator(RegexEliminator):
     """
@@ -225,24 +431,432 @@ class Unidecoder(_NoFitNeededTransformer):
         y = column_or_1d(y, warn=True)
         return _unidecode(y)
 
+    def transform_one(self, x):
+        return _unidecode_one(x)
+
 
 class Spacy(_NoFitNeededTransformer):
     """
     A transformer that transforms labels to normalized company names.
+
+    By default each label is processed by a separate ``nlp`` call.
+    With ``batch_size`` set labels are streamed through ``nlp.pipe``
+    with components not needed for entity extraction disabled,
+    the result is the same.
+
+    With ``fast_path`` set labels which pass a cheap check
+    (at most ``max_tokens`` tokens and no separators, see
+    `cmnsim.misc.spacy_wrapper.needs_ner`) are returned as is,
+    only the rest go to spacy. The output may differ from the full
+    mode, use `validate_fast_path` to measure it on a dataset.
+    `path_counts` reports how often each path was taken.
+
+    Args:
+        batch_size: Number of labels in a spacy batch, None to
+         process labels one by one.
+        n_process: Number of spacy processes in batched mode.
+        fast_path: Whether to skip spacy for labels, which don't need it.
+        max_tokens: Max number of tokens of a label on the fast path.
     """
 
+    def __init__(self, batch_size=None, n_process=1, fast_path=False, max_tokens=3):
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.fast_path = fast_path
+        self.max_tokens = max_tokens
+
+    @property
+    def batched(self):
+        return self.batch_size is not None
+
+    @property
+    def path_counts(self):
+        """Number of labels, which took the fast path and went to spacy."""
+        counts = getattr(self, "_path_counts", Counter())
+        return {"fast": counts["fast"], "ner": counts["ner"]}
+
+    def reset_path_counts(self):
+        """
+        Reset `path_counts`.
+
+        Returns:
+            None
+        """
+
+        self._path_counts = Counter()
+
+    def _count(self, fast, ner_):
+        if not hasattr(self, "_path_counts"):
+            self.reset_path_counts()
+        self._path_counts["fast"] += fast
+        self._path_counts["ner"] += ner_
+
+    def fingerprint(self):
+        if self.fast_path:
+            return f"{type(self).__name__}\tfast_path\t{self.max_tokens}"
+        return type(self).__name__
+
+    def _ner(self, y):
+        """Run spacy on all labels."""
+
+        if self.batched:
+            return np.array(
+                list(
+                    ner.process_spacy_batch(
+                        y, batch_size=self.batch_size, n_process=self.n_process
+                    )
+                ),
+                dtype=str,
+            )
+
+        return _nerd_vectorized(y)
+
     def transform(self, y):
         """Transform labels to normalized company names."""
         y = column_or_1d(y, warn=True)
-        return _nerd_vectorized(y)
+
+        if not self.fast_path:
+            self._count(0, len(y))
+            return self._ner(y)
+
+        mask = np.array([ner.needs_ner(x, self.max_tokens) for x in y], dtype=bool)
+        self._count(len(y) - mask.sum(), mask.sum())
+
+        result = np.array(y, dtype=object)
+        if mask.any():
+            result[mask] = self._ner(y[mask])
+        return result.astype(str)
+
+    def transform_one(self, x):
+        if self.fast_path and not ner.needs_ner(x, self.max_tokens):
+            self._count(1, 0)
+            return x
+
+        self._count(0, 1)
+        return ner.process_spacy(x)
+
+
+def _make_stage(step):
+    """
+    Make a pipeline stage.
+
+    Args:
+        step: Transformer name from this module or transformer instance.
+
+    Returns:
+        Transformer instance.
+    """
+
+    if isinstance(step, str):
+        return getattr(sys.modules[__name__], step)()
+    return step
 
 
 # noinspection PyPep8Naming
-def FullTransformersPipeline() -> Pipeline:
+def FullTransformersPipeline():
+    from sklearn.pipeline import Pipeline
+
     return Pipeline(
         [
-            (tr, getattr(sys.modules[__name__], tr)())
+            (tr, _make_stage(tr))
             for tr in _PIPELINE_ORDER
             if tr != "FullTransformersPipeline"
         ]
     )
+
+
+class FusedNormalizer(_NoFitNeededTransformer):
+    """
+    Single-pass equivalent of `FullTransformersPipeline`.
+
+    Each name goes through all stages one after another, so there are
+    no intermediate arrays or ``pd.Series`` between stages and every
+    regex is compiled once. The order of stages is kept, the output is
+    identical to the ordered pipeline.
+
+    Stages with ``batched`` set (e.g. ``Spacy(batch_size=256)``) are
+    applied to the whole column instead, the stages between them
+    are still fused.
+
+    With ``cache`` set names are looked up in a `NormalizationCache`
+    first, keyed by `version` of the stage list, and only unique
+    missing names are normalized.
+
+    With ``n_jobs`` other than 1 inputs longer than ``chunk_size`` are
+    split into chunks, which are normalized by a pool of processes and
+    gathered in the original order. Each worker preloads the stages
+    (e.g. the spacy model) once. The pool is kept between calls and
+    restarted if ``n_jobs`` or ``steps`` change, `close` shuts it down.
+
+    Args:
+        steps: Stages to apply, transformer names or instances.
+         Defaults to the full pipeline order.
+        cache: `cmnsim.cache.NormalizationCache` instance or None.
+        n_jobs: Number of worker processes, -1 for all CPUs.
+        chunk_size: Number of names sent to a worker at once.
+
+    Examples:
+        >>> from cmnsim.preprocessing import FusedNormalizer
+        >>> normalizer = FusedNormalizer(steps=["NumbersEliminator", "Lowercaser"])
+        >>> normalizer.transform(['ООО "Рога и Копыта 123"'])
+        array(['ооо "рога и копыта"'], dtype='<U18')
+        >>> normalizer.normalize('ООО "Рога и Копыта 123"')
+        'ооо "рога и копыта"'
+    """
+
+    def __init__(self, steps=None, cache=None, n_jobs=1, chunk_size=1000):
+        self.steps = steps
+        self.cache = cache
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_executor", None)
+        return state
+
+    def _stages(self):
+        """Return stage instances, built once per steps."""
+
+        steps = tuple(_PIPELINE_ORDER if self.steps is None else self.steps)
+        if getattr(self, "_stages_steps", None) != steps:
+            self._stages_cache = [_make_stage(step) for step in steps]
+            self._stages_steps = steps
+            self._version = pipeline_version(
+                stage.fingerprint() for stage in self._stages_cache
+            )
+        return self._stages_cache
+
+    @property
+    def version(self):
+        """Version of the stage list, changes with stages and their settings."""
+        self._stages()
+        return self._version
+
+    def normalize(self, x):
+        """
+        Normalize a single name.
+
+        Args:
+            x: Name to normalize.
+
+        Returns:
+            Normalized name.
+        """
+
+        if self.cache is not None:
+            return self.cache.memoize(self._normalize, self.version)(x)
+        return self._normalize(x)
+
+    def _normalize(self, x):
+        for stage in self._stages():
+            x = stage.transform_one(x)
+        return x
+
+    def transform(self, y):
+        """Transform labels to normalized company names."""
+        y = column_or_1d(y, warn=True)
+
+        if self.cache is None:
+            return self._transform(y)
+
+        version = self.version
+        known = self.cache.get_many(version, y)
+        missing = [x for x in dict.fromkeys(str(x) for x in y) if x not in known]
+
+        if missing:
+            computed = dict(zip(missing, self._transform(missing)))
+            self.cache.set_many(version, computed)
+            known.update(computed)
+
+        return np.array([known[str(x)] for x in y], dtype=str)
+
+    def _transform(self, y):
+        n_jobs = (os.cpu_count() or 1) if self.n_jobs == -1 else self.n_jobs
+
+        if n_jobs <= 1 or len(y) <= self.chunk_size:
+            return self._transform_serial(y)
+
+        size = self.chunk_size
+        chunks = [y[i : i + size] for i in range(0, len(y), size)]
+        return np.concatenate(list(self._pool(n_jobs).map(_worker_transform, chunks)))
+
+    def _pool(self, n_jobs):
+        """Return worker pool, restarted if `n_jobs` or `steps` changed."""
+
+        key = n_jobs, tuple(_PIPELINE_ORDER if self.steps is None else self.steps)
+        if getattr(self, "_executor_key", None) != key:
+            self.close()
+
+        if getattr(self, "_executor", None) is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=n_jobs,
+                initializer=_init_worker,
+                initargs=(FusedNormalizer(steps=self.steps),),
+            )
+            self._executor_key = key
+        return self._executor
+
+    def warmup(self):
+        """
+        Load all stages ahead of time.
+
+        Servers should call it before accepting traffic, so the first
+        request does not pay for imports and the spacy model load.
+
+        Returns:
+            self.
+        """
+
+        for stage in self._stages():
+            stage.preload()
+        return self
+
+    def close(self):
+        """
+        Shut down the worker pool, if any.
+
+        Returns:
+            None
+        """
+
+        executor = getattr(self, "_executor", None)
+        if executor is not None:
+            executor.shutdown()
+            self._executor = None
+
+    def _transform_serial(self, y):
+        if profiler.enabled:
+            return self._transform_profiled(y)
+
+        kernels = []
+        for stage in self._stages():
+            if stage.batched:
+                if kernels:
+                    y = _apply_kernels(kernels, y)
+                y = stage.transform(y)
+                kernels = []
+            else:
+                kernels.append(stage.transform_one)
+
+        return _apply_kernels(kernels, y)
+
+    def _transform_profiled(self, y):
+        """Apply stages one by one, recording each of them."""
+
+        for stage in self._stages():
+            if stage.batched:
+                y = stage.transform(y)
+                continue
+
+            start = time.perf_counter()
+            transformed = [stage.transform_one(x) for x in y]
+            profiler.record(
+                type(stage).__name__, time.perf_counter() - start, y, transformed
+            )
+            y = transformed
+
+        return np.array(y, dtype=str)
+
+    def transform_one(self, x):
+        return self.normalize(x)
+
+
+def default_steps(**spacy_params):
+    """
+    Get stages of the full pipeline with configured spacy stage.
+
+    Args:
+        **spacy_params: Parameters of `Spacy` stage.
+
+    Returns:
+        List of stages for `FusedNormalizer`.
+
+    Examples:
+        >>> from cmnsim.preprocessing import FusedNormalizer, default_steps
+        >>> normalizer = FusedNormalizer(steps=default_steps(fast_path=True))
+    """
+
+    return [
+        Spacy(**spacy_params) if step == "Spacy" else step for step in _PIPELINE_ORDER
+    ]
+
+
+def validate_fast_path(names, max_tokens=3):
+    """
+    Compare normalization with and without spacy fast path.
+
+    Args:
+        names: Array-like names, e.g. a validation set.
+        max_tokens: Max number of tokens of a name on the fast path.
+
+    Returns:
+        Dict with number of names on each path, number and share of
+        normalized names, which differ from the full mode, and a few
+        examples of them.
+    """
+
+    names = column_or_1d(names, warn=True)
+    steps = default_steps(fast_path=True, max_tokens=max_tokens)
+    spacy = next(step for step in steps if isinstance(step, Spacy))
+
+    full = FusedNormalizer(steps=default_steps()).transform(names)
+    fast = FusedNormalizer(steps=steps).transform(names)
+
+    differ = np.flatnonzero(full != fast)
+    return {
+        **spacy.path_counts,
+        "fast_rate": spacy.path_counts["fast"] / len(names) if len(names) else 0.0,
+        "differ": len(differ),
+        "differ_rate": len(differ) / len(names) if len(names) else 0.0,
+        "examples": [(names[i], full[i], fast[i]) for i in differ[:10]],
+    }
+
+
+def warmup(steps=None):
+    """
+    Import dependencies of the stages and load the spacy model.
+
+    Args:
+        steps: Stages to load, the full pipeline by default.
+
+    Returns:
+        None
+    """
+
+    FusedNormalizer(steps=steps).warmup()
+
+
+def _apply_kernels(kernels, y):
+    """
+    Apply per-string kernels to each label in one pass.
+
+    Args:
+        kernels: Per-string kernels, in order.
+        y: Array-like labels.
+
+    Returns:
+        Array of transformed labels.
+    """
+
+    result = []
+    for x in y:
+        for kernel in kernels:
+            x = kernel(x)
+        result.append(x)
+    return np.array(result, dtype=str)
+
+
+_worker_normalizer = None
+
+
+def _init_worker(normalizer):
+    """Set up a pool worker: keep the normalizer and preload its stages."""
+
+    global _worker_normalizer
+    _worker_normalizer = normalizer.warmup()
+
+
+def _worker_transform(chunk):
+    """Normalize a chunk in a pool worker."""
+    return _worker_normalizer._transform_serial(chunk)
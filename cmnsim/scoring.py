@@ -0,0 +1,408 @@
+"""
+Module that contains the batched scoring engine of pairs of names.
+
+All five features of `CNFuzzyClassifier` are computed for a batch of
+pairs in one pass. Each distinct string is tokenized once, tokens are
+kept in a cache shared by all features and calls. With rapidfuzz>=3.6
+installed (it has `process.cpdist`) ratios are computed by its compiled
+batch functions, the results are the same as of fuzzywuzzy.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import FrozenSet, Iterable, List, NamedTuple
+
+import numpy as np
+
+__all__ = [
+    "FEATURES",
+    "FEATURE_MAX",
+    "BACKENDS",
+    "Tokens",
+    "TokenCache",
+    "feature_columns",
+    "score_pairs",
+    "subs_ratio",
+    "token_cache",
+    "tokenize",
+]
+
+# Columns of the feature matrix, the order of `CNFuzzyClassifier` weights.
+FEATURES = (
+    "ratio",
+    "partial_ratio",
+    "token_sort_ratio",
+    "subs_ratio",
+    "token_set_ratio",
+)
+
+# Max values of the features, `subs_ratio` is a fraction.
+FEATURE_MAX = np.array([100, 100, 100, 1, 100], dtype=np.float_)
+
+BACKENDS = ("auto", "rapidfuzz", "fuzzywuzzy")
+
+_EXECUTORS = {"process": ProcessPoolExecutor, "thread": ThreadPoolExecutor}
+
+
+class Tokens(NamedTuple):
+    """Tokens of a string used by the features."""
+
+    tokens: List[str]
+    token_set: FrozenSet[str]
+    processed: str
+    sorted_tokens: str
+    processed_set: FrozenSet[str]
+
+
+def tokenize(s: str) -> Tokens:
+    """
+    Split a string into tokens used by the features.
+
+    `tokens` and `token_set` are whitespace-separated words of the raw
+    string (used by `subs_ratio`), `sorted_tokens` and `processed_set`
+    are words of the string processed by fuzzywuzzy (used by token sort
+    and token set ratios).
+
+    Args:
+        s: String.
+
+    Returns:
+        Tokens of the string.
+    """
+
+    from fuzzywuzzy.utils import full_process
+
+    tokens = s.split()
+    processed = full_process(s, force_ascii=True)
+    processed_tokens = processed.split()
+    return Tokens(
+        tokens=tokens,
+        token_set=frozenset(tokens),
+        processed=processed,
+        sorted_tokens=" ".join(sorted(processed_tokens)),
+        processed_set=frozenset(processed_tokens),
+    )
+
+
+class TokenCache:
+    """
+    LRU cache of `Tokens` of strings.
+
+    Shared by all features and all pairs, so a name compared
+    against many candidates is tokenized once.
+
+    Args:
+        maxsize: Max number of cached strings.
+
+    Attributes:
+        hits: Number of lookups served from the cache.
+        misses: Number of tokenized strings.
+
+    Methods:
+        get: Get tokens of a string.
+        get_many: Get tokens of several strings.
+        clear: Drop all entries.
+
+    Examples:
+        >>> from cmnsim.scoring import TokenCache
+        >>> cache = TokenCache()
+        >>> cache.get("Big Pharma, LLC").sorted_tokens
+        'big llc pharma'
+    """
+
+    def __init__(self, maxsize=131072):
+        self.maxsize = maxsize
+
+        self.hits = 0
+        self.misses = 0
+
+        self._tokens: "OrderedDict[str, Tokens]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, s: str) -> Tokens:
+        """
+        Get tokens of a string.
+
+        Args:
+            s: String.
+
+        Returns:
+            Tokens of the string.
+        """
+
+        return self.get_many([s])[0]
+
+    def get_many(self, strings: Iterable[str]) -> List[Tokens]:
+        """
+        Get tokens of several strings.
+
+        Args:
+            strings: Strings.
+
+        Returns:
+            Tokens of the strings, in order.
+        """
+
+        result = []
+        with self._lock:
+            for s in strings:
+                tokens = self._tokens.get(s)
+                if tokens is None:
+                    tokens = self._tokens[s] = tokenize(s)
+                    self.misses += 1
+                    if len(self._tokens) > self.maxsize:
+                        self._tokens.popitem(last=False)
+                else:
+                    self._tokens.move_to_end(s)
+                    self.hits += 1
+                result.append(tokens)
+
+        return result
+
+    def clear(self):
+        """
+        Drop all entries and reset counters.
+
+        Returns:
+            None
+        """
+
+        with self._lock:
+            self._tokens.clear()
+            self.hits = self.misses = 0
+
+
+# Cache shared by all `score_pairs` calls of a process.
+token_cache = TokenCache()
+
+
+def subs_ratio(s1: str, s2: str) -> float:
+    """
+    Calculate the ratio of the number of words in common between two strings
+
+    Args:
+        s1: First string.
+        s2: Second string.
+
+    Returns:
+        The ratio of the number of words in common between two strings.
+    """
+
+    return _subs_ratio(tokenize(s1), tokenize(s2))
+
+
+def _subs_ratio(t1: Tokens, t2: Tokens) -> float:
+    """`subs_ratio` of tokenized strings."""
+
+    s1ins2 = sum(map(t2.token_set.__contains__, t1.tokens))
+    s2ins1 = sum(map(t1.token_set.__contains__, t2.tokens))
+    return (s1ins2 + s2ins1) / (len(t1.tokens) + len(t2.tokens))
+
+
+def _has_rapidfuzz() -> bool:
+    """Check whether rapidfuzz with batch functions is installed."""
+
+    try:
+        from rapidfuzz.process import cpdist
+    except ImportError:
+        return False
+    return True
+
+
+def _resolve_backend(backend: str) -> str:
+    """Get backend name to use."""
+
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}, not {backend!r}")
+
+    if backend == "auto":
+        return "rapidfuzz" if _has_rapidfuzz() else "fuzzywuzzy"
+
+    if backend == "rapidfuzz" and not _has_rapidfuzz():
+        raise ImportError("rapidfuzz>=3.6 is required for the rapidfuzz backend")
+
+    return backend
+
+
+def _token_set_strings(t1: Tokens, t2: Tokens):
+    """Get strings compared by `fuzz.token_set_ratio`."""
+
+    sect = " ".join(sorted(t1.processed_set & t2.processed_set))
+    diff1to2 = " ".join(sorted(t1.processed_set - t2.processed_set))
+    diff2to1 = " ".join(sorted(t2.processed_set - t1.processed_set))
+    return sect, f"{sect} {diff1to2}".strip(), f"{sect} {diff2to1}".strip()
+
+
+def _ratio_functions(backend: str):
+    """Get batch ratio and pairwise partial ratio of a backend."""
+
+    if backend == "rapidfuzz":
+        from rapidfuzz.distance import Indel, Levenshtein
+        from rapidfuzz.fuzz import ratio as rapidfuzz_ratio
+        from rapidfuzz.process import cpdist
+
+        def cpdist_ratio(a, b):
+            # float32 default would round some x.5 scores the other way
+            return np.round(cpdist(a, b, scorer=rapidfuzz_ratio, dtype=np.float64))
+
+        def partial_ratio(s1, s2):
+            # same as `fuzz.partial_ratio`: substrings are aligned with
+            # matching blocks of Levenshtein opcodes, as python-Levenshtein
+            # does for fuzzywuzzy
+            if s1 == s2:
+                return 100
+            if not s1 or not s2:
+                return 0
+
+            shorter, longer = (s1, s2) if len(s1) <= len(s2) else (s2, s1)
+
+            best = 0.0
+            for a, b, _ in Levenshtein.opcodes(shorter, longer).as_matching_blocks():
+                start = b - a if b > a else 0
+                r = Indel.normalized_similarity(
+                    shorter, longer[start : start + len(shorter)]
+                )
+                if r > 0.995:
+                    return 100
+                if r > best:
+                    best = r
+
+            return int(round(100 * best))
+
+        return cpdist_ratio, partial_ratio
+
+    from fuzzywuzzy import fuzz
+
+    def pairwise_ratio(a, b):
+        return np.array([fuzz.ratio(x, y) for x, y in zip(a, b)], dtype=np.float_)
+
+    return pairwise_ratio, fuzz.partial_ratio
+
+
+def _token_set_ratio(t_lhs, t_rhs, ratio) -> np.ndarray:
+    """`fuzz.token_set_ratio` of tokenized strings."""
+
+    # token ratios are ratios of strings made of processed tokens,
+    # same as in fuzzywuzzy
+    sect, combined_1to2, combined_2to1 = zip(
+        *[_token_set_strings(t1, t2) for t1, t2 in zip(t_lhs, t_rhs)]
+    ) or ((), (), ())
+    token_set = np.max(
+        [
+            ratio(sect, combined_1to2),
+            ratio(sect, combined_2to1),
+            ratio(combined_1to2, combined_2to1),
+        ],
+        axis=0,
+    )
+    token_set[[not (t1.processed and t2.processed) for t1, t2 in zip(t_lhs, t_rhs)]] = 0
+    return token_set
+
+
+def feature_columns(lhs, rhs, features=FEATURES, backend="auto", cache=None):
+    """
+    Compute some of the features for pairs of names.
+
+    Args:
+        lhs: Left names.
+        rhs: Right names.
+        features: Names of the features to compute, see `FEATURES`.
+        backend: "rapidfuzz", "fuzzywuzzy" or "auto".
+        cache: `TokenCache`, the shared `token_cache` by default.
+
+    Returns:
+        Float array of shape (n_samples, len(features)).
+    """
+
+    cache = token_cache if cache is None else cache
+    ratio, partial_ratio = _ratio_functions(_resolve_backend(backend))
+
+    lhs = [str(x) for x in lhs]
+    rhs = [str(x) for x in rhs]
+    t_lhs = cache.get_many(lhs)
+    t_rhs = cache.get_many(rhs)
+
+    columns = {
+        "ratio": lambda: ratio(lhs, rhs),
+        "partial_ratio": lambda: [partial_ratio(s1, s2) for s1, s2 in zip(lhs, rhs)],
+        "token_sort_ratio": lambda: ratio(
+            [t.sorted_tokens for t in t_lhs], [t.sorted_tokens for t in t_rhs]
+        ),
+        "subs_ratio": lambda: [_subs_ratio(t1, t2) for t1, t2 in zip(t_lhs, t_rhs)],
+        "token_set_ratio": lambda: _token_set_ratio(t_lhs, t_rhs, ratio),
+    }
+
+    return np.column_stack(
+        [np.asarray(columns[feature](), dtype=np.float_) for feature in features]
+    ).reshape(len(lhs), len(features))
+
+
+def _score_chunk(
+    chunk: np.ndarray, backend: str, cache=None, features=FEATURES
+) -> np.ndarray:
+    """Score a chunk of pairs."""
+    return feature_columns(chunk[:, 0], chunk[:, 1], features, backend, cache)
+
+
+def score_pairs(
+    X,
+    backend="auto",
+    chunk_size=10000,
+    n_jobs=1,
+    executor="process",
+    cache=None,
+    features=FEATURES,
+) -> np.ndarray:
+    """
+    Compute features of `CNFuzzyClassifier` for pairs of names.
+
+    Args:
+        X: Array-like of shape (n_samples, 2) with pairs of names.
+        backend: "rapidfuzz" (compiled), "fuzzywuzzy" (pure python)
+         or "auto" to use rapidfuzz if installed.
+        chunk_size: Number of pairs scored at once.
+        n_jobs: Number of workers, -1 for all CPUs. Chunks are scored
+         in parallel if there is more than one.
+        executor: "process" or "thread", threads help with the
+         rapidfuzz backend only.
+        cache: `TokenCache`, the shared `token_cache` by default.
+         Worker processes use their own caches.
+        features: Names of the features to compute, all `FEATURES`
+         by default.
+
+    Returns:
+        Float array of shape (n_samples, len(features)).
+
+    Examples:
+        >>> from cmnsim.scoring import score_pairs
+        >>> score_pairs([["big pharma", "pharma big"]])
+        array([[ 60.,  60., 100.,   1., 100.]])
+    """
+
+    X = np.asarray(X, dtype=object)
+    assert X.ndim == 2 and X.shape[1] == 2
+
+    backend = _resolve_backend(backend)
+    if executor not in _EXECUTORS:
+        raise ValueError(
+            f"executor must be one of {tuple(_EXECUTORS)}, not {executor!r}"
+        )
+
+    chunks = [X[i : i + chunk_size] for i in range(0, len(X), chunk_size)]
+    if not chunks:
+        return np.empty((0, len(features)), dtype=np.float_)
+
+    n_jobs = (os.cpu_count() or 1) if n_jobs == -1 else n_jobs
+    if n_jobs <= 1 or len(chunks) == 1:
+        return np.concatenate(
+            [_score_chunk(chunk, backend, cache, features) for chunk in chunks]
+        )
+
+    n = len(chunks)
+    caches = [cache if executor == "thread" else None] * n
+    with _EXECUTORS[executor](max_workers=min(n_jobs, n)) as pool:
+        return np.concatenate(
+            list(pool.map(_score_chunk, chunks, [backend] * n, caches, [features] * n))
+        )
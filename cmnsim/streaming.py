@@ -0,0 +1,206 @@
+"""Module that contains streaming, chunked preprocessing of names."""
+
+import csv
+import io
+from itertools import islice
+from os import PathLike
+from typing import Iterable, Iterator, List, TextIO, Union, cast
+
+import numpy as np
+
+__all__ = [
+    "iter_chunks",
+    "read_names",
+    "normalize_stream",
+]
+
+Source = Union[str, PathLike, io.IOBase, Iterable[str]]
+Column = Union[int, str]
+
+_READERS = ("csv", "pandas", "pyarrow")
+
+
+def iter_chunks(iterable: Iterable, chunk_size: int) -> Iterator[List]:
+    """
+    Split iterable into lists of at most `chunk_size` items.
+
+    Args:
+        iterable: Any iterable.
+        chunk_size: Max size of a chunk.
+
+    Yields:
+        Lists of items, in order.
+
+    Examples:
+        >>> from cmnsim.streaming import iter_chunks
+        >>> list(iter_chunks(range(5), 2))
+        [[0, 1], [2, 3], [4]]
+    """
+
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be positive, not {chunk_size}")
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _is_csv(source) -> bool:
+    """Check whether source is a CSV path or file object."""
+    return isinstance(source, (str, PathLike, io.IOBase))
+
+
+def _column_index(header: List[str], column: Column) -> int:
+    """Find index of a column in the CSV header."""
+
+    if isinstance(column, int):
+        return column
+
+    try:
+        return header.index(column)
+    except ValueError:
+        raise KeyError(f"Column {column!r} not found in CSV header {header}")
+
+
+def _read_csv(source, column: Column, header: bool, chunk_size: int):
+    """Read names with stdlib csv module."""
+
+    f = (
+        open(source, newline="", encoding="utf-8")
+        if not isinstance(source, io.IOBase)
+        else cast(TextIO, source)
+    )
+
+    try:
+        rows = csv.reader(f)
+        head = next(rows, []) if header else []
+        index = _column_index(head, column)
+        yield from iter_chunks(
+            (row[index] if len(row) > index else "" for row in rows), chunk_size
+        )
+    finally:
+        if f is not source:
+            f.close()
+
+
+def _read_pandas(source, column: Column, header: bool, chunk_size: int):
+    """Read names with `pd.read_csv` in chunks."""
+
+    import pandas as pd
+
+    chunks = pd.read_csv(
+        source,
+        usecols=[column],
+        header=0 if header else None,
+        chunksize=chunk_size,
+        dtype=str,
+        keep_default_na=False,
+    )
+    for df in chunks:
+        yield df.iloc[:, 0].tolist()
+
+
+def _read_pyarrow(source, column: Column, header: bool, chunk_size: int):
+    """Read names with streaming `pyarrow.csv` reader."""
+
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    if isinstance(source, PathLike):
+        source = str(source)
+
+    reader = pa_csv.open_csv(
+        source,
+        read_options=pa_csv.ReadOptions(autogenerate_column_names=not header),
+        convert_options=pa_csv.ConvertOptions(strings_can_be_null=False),
+    )
+
+    index = _column_index(reader.schema.names, column)
+
+    def names():
+        for batch in reader:
+            values = batch.column(index).cast(pa.string())
+            yield from ("" if x is None else x for x in values.to_pylist())
+
+    yield from iter_chunks(names(), chunk_size)
+
+
+def read_names(
+    source: Source,
+    column: Column = 0,
+    header: bool = True,
+    chunk_size: int = 10000,
+    reader: str = "csv",
+) -> Iterator[List[str]]:
+    """
+    Read names from iterable or CSV in bounded-size chunks.
+
+    Only one chunk is kept in memory at a time.
+
+    Args:
+        source: Iterable of names, path to CSV file or file object.
+        column: CSV column name or index.
+        header: Whether CSV has a header row.
+        chunk_size: Max number of names in a chunk.
+        reader: CSV reader: "csv" (stdlib), "pandas" or "pyarrow",
+         pyarrow needs a path or a binary file object.
+
+    Yields:
+        Lists of names, in order.
+    """
+
+    if not _is_csv(source):
+        names = cast(Iterable[str], source)
+        yield from iter_chunks((str(x) for x in names), chunk_size)
+        return
+
+    if reader not in _READERS:
+        raise ValueError(f"reader must be one of {_READERS}, not {reader!r}")
+
+    read = {"csv": _read_csv, "pandas": _read_pandas, "pyarrow": _read_pyarrow}[reader]
+    yield from read(source, column, header, chunk_size)
+
+
+def normalize_stream(
+    source: Source,
+    normalizer=None,
+    column: Column = 0,
+    header: bool = True,
+    chunk_size: int = 10000,
+    reader: str = "csv",
+) -> Iterator[np.ndarray]:
+    """
+    Normalize names from iterable or CSV in bounded-size chunks.
+
+    Memory does not depend on the size of the input.
+
+    Args:
+        source: Iterable of names, path to CSV file or file object.
+        normalizer: Transformer to apply to each chunk,
+         `FusedNormalizer()` by default.
+        column: CSV column name or index.
+        header: Whether CSV has a header row.
+        chunk_size: Max number of names in a chunk.
+        reader: CSV reader: "csv" (stdlib), "pandas" or "pyarrow".
+
+    Yields:
+        Arrays of normalized names, in order.
+
+    Examples:
+        >>> from cmnsim.preprocessing import FusedNormalizer
+        >>> from cmnsim.streaming import normalize_stream
+        >>> normalizer = FusedNormalizer(steps=["Lowercaser"])
+        >>> list(normalize_stream(["A", "B", "C"], normalizer, chunk_size=2))
+        [array(['a', 'b'], dtype='<U1'), array(['c'], dtype='<U1')]
+    """
+
+    if normalizer is None:
+        from cmnsim.preprocessing import FusedNormalizer
+
+        normalizer = FusedNormalizer()
+
+    for chunk in read_names(source, column, header, chunk_size, reader):
+        yield normalizer.transform(chunk)
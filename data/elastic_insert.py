@@ -1,26 +1,46 @@
+import csv
+import os
+from itertools import tee
 from pathlib import Path
 
 import pandas as pd
 from elasticsearch import Elasticsearch, helpers
 
-from cmnsim.preprocessing import FullTransformersPipeline
+from cmnsim.cache import NormalizationCache
+from cmnsim.preprocessing import FusedNormalizer
+from cmnsim.streaming import iter_chunks, normalize_stream
+from gateway.search_engine.schemas import document_id, elastic_upsert
 
 es = Elasticsearch(["http://localhost:9200/"])
 print(es.ping())
 
 pd.set_option("display.width", None)
 
+CHUNK_SIZE = 2000
+MERGE_POLICY = os.getenv("ELASTIC_MERGE_POLICY", "fill")
+RETRY_ON_CONFLICT = 3
 
-def preprocess(lb, ub):
-    df = pd.read_csv(Path(__file__).parent.joinpath("0-train-raw.csv"))
+normalizer = FusedNormalizer(
+    cache=NormalizationCache.from_env(),
+    n_jobs=int(os.getenv("CMNSIM_N_JOBS", 1)),
+)
 
-    df = df[df["is_duplicate"] == 0][lb:ub]
 
-    names = pd.concat([df["name_1"], df["name_2"]])
-    names.drop_duplicates(inplace=True)
-    names = names[names.str.len() >= 2]
+def read_names(path):
+    """Names from pairs which are not duplicates, at least 2 chars long."""
 
-    normalized = pd.Series(FullTransformersPipeline().transform(names))
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row["is_duplicate"] != "0":
+                continue
+
+            for name in (row["name_1"], row["name_2"]):
+                if len(name) >= 2:
+                    yield name
+
+
+def preprocess(names, normalized):
+    normalized = pd.Series(normalized)
 
     frame = {
         "company_name": normalized.str.capitalize(),
@@ -29,19 +49,23 @@ def preprocess(lb, ub):
     df = pd.DataFrame(frame)
     df["normalized_name"] = normalized
     df["company_url"] = ""
-    df["query_string"] = pd.Series(names.values)
-    df["id"] = df.index
+    df["query_string"] = pd.Series(names)
+    df.drop_duplicates("query_string", inplace=True)
 
     return df
 
 
 def doc_generator(df, index_name):
-    df_iter = df.iterrows()
-    for index, document in df_iter:
+    """Upserts keyed by normalized names, as the gateway writes them."""
+
+    for _, document in df.iterrows():
+        data = document.to_dict()
         res = {
+            "_op_type": "update",
             "_index": index_name,
-            # "_id": f"{document['id']}",
-            "_source": {key: value for key, value in document.items() if key != "id"},
+            "_id": document_id(data["normalized_name"]),
+            "retry_on_conflict": RETRY_ON_CONFLICT,
+            **elastic_upsert(data, MERGE_POLICY),
         }
         print(res)
         yield res
@@ -50,9 +74,18 @@ def doc_generator(df, index_name):
 def main():
     from rich.progress import track
 
-    for lindex in track(range(0, 497000, 1000)):
-        df = preprocess(lindex, lindex + 1000)
-        helpers.bulk(es, doc_generator(df, "test"))
+    # names are read and normalized in chunks, memory does not depend
+    # on the size of the dataset
+    names, to_normalize = tee(
+        read_names(Path(__file__).parent.joinpath("0-train-raw.csv"))
+    )
+    chunks = zip(
+        iter_chunks(names, CHUNK_SIZE),
+        normalize_stream(to_normalize, normalizer, chunk_size=CHUNK_SIZE),
+    )
+
+    for raw, normalized in track(chunks, description="Inserting..."):
+        helpers.bulk(es, doc_generator(preprocess(raw, normalized), "test"))
 
 
 if __name__ == "__main__":
@@ -10,6 +10,7 @@ from sanic_ext import validate
 from sanic_healthcheck import HealthCheck
 
 from gateway.sessions import setup
+from gateway.utils.bulk import BulkTooLarge, insert_items, parse_bulk_body
 
 app = Sanic("cmnsim-search")
 setup(app)
@@ -49,9 +50,38 @@ async def insert(request: Request, body: InsertItem):
     await request.app.ctx.cn_searcher.es_storage.insert_data(
         request.app.ctx.es_index, body.dict()
     )
+    await request.app.ctx.cn_searcher.on_insert(body.normalized_name)
     return json({}, status=202)
 
 
+@app.route("/insert/bulk", methods=["POST"])
+@protected
+async def insert_bulk(request: Request):
+    try:
+        raw_items = parse_bulk_body(
+            request.body, max_items=int(os.getenv("BULK_MAX_ITEMS", 10000))
+        )
+    except BulkTooLarge as e:
+        return json({"error": str(e)}, status=413)
+    except ValueError as e:
+        return json({"error": str(e)}, status=400)
+
+    inserted, errors = await insert_items(
+        request.app.ctx.cn_searcher.es_storage,
+        request.app.ctx.es_index,
+        raw_items,
+        InsertItem,
+        chunk_size=int(os.getenv("BULK_CHUNK_SIZE", 500)),
+        concurrency=int(os.getenv("BULK_CONCURRENCY", 4)),
+    )
+
+    await request.app.ctx.cn_searcher.on_insert(*inserted)
+
+    return json(
+        {"inserted": len(inserted), "errors": errors}, status=207 if errors else 202
+    )
+
+
 @app.route("/search", methods=["POST"])
 @validate(json=SearchItem)
 @protected
@@ -61,6 +91,13 @@ async def search(request, body: SearchItem):
     return json(result)
 
 
+@app.route("/metrics", methods=["GET"])
+@protected
+async def metrics(request: Request):
+    cache = request.app.ctx.cn_searcher.result_cache
+    return json({"search_cache": await cache.metrics() if cache else None})
+
+
 # Define checks for the health check.
 def check_health_random():
     return True, "Service is healthy"
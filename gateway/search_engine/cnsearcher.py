@@ -1,16 +1,22 @@
+import asyncio
 import json
 import logging
-from functools import partial
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from bs4 import BeautifulSoup
 
+from cmnsim.cache import NormalizationCache, pipeline_version
 from cmnsim.misc.returns import Error
 from cmnsim.misc.spacy_wrapper import process_spacy
 from gateway.crawling.crawler import Crawler
 from gateway.search_engine.elasti import CNElasticStorage
-from gateway.search_engine.schemas import search_response_from_crawler
+from gateway.search_engine.schemas import (
+    search_response_from_crawler,
+    search_response_from_index,
+)
 from gateway.utils import gsearch
-from gateway.utils.merger import merge_matches
 
 log = logging.getLogger(__name__)
 
@@ -48,7 +54,6 @@ def parse_title_from_html(html):
 
 
 class CNSearcher:
-
     """
     CNSearch encapsulates search logic.
 
@@ -64,44 +69,120 @@ class CNSearcher:
     Args:
         uri: ES URI.
         index_name: ES index name.
+        timeout: ES request timeout.
+        name_index: `cmnsim.name_index.NameIndex` of normalized names,
+         searched if ES does not answer within `fallback_timeout`.
+         It is updated and searched in a worker thread, one call at
+         a time, not to block the event loop.
+        fallback_timeout: Seconds to wait for ES if `name_index` is set.
+        merge_policy: How inserts update existing documents, see
+         `CNElasticStorage`.
 
     Attributes:
         es_storage: ES storage.
         uri: ES URI.
         index_name: ES index name.
         crawler: Crawler instance.
+        name_index: Local index of normalized names or None, names are
+         added on inserts, see `save_name_index`.
+        result_cache: `SearchCache` of results or None.
+        write_buffer: `WriteBehindBuffer` of crawled items or None.
 
     Methods:
         __call__: Search for company name in ES.
+        save_name_index: Save the local index with inserted names.
         close: Close ES connection.
 
     """
 
     TARGET_FIELDS = ["company_name", "company_url", "normalized_name", "query_string"]
 
-    def __init__(self, uri, index_name, timeout=10):
+    def __init__(
+        self,
+        uri,
+        index_name,
+        timeout=10,
+        name_index=None,
+        fallback_timeout=1.0,
+        merge_policy="fill",
+    ):
         """
         Initialize CNSearcher.
 
         Args:
             uri: ES URI.
             index_name: ES index name.
+            timeout: ES request timeout.
+            name_index: Local index of normalized names.
+            fallback_timeout: Seconds to wait for ES if `name_index` is set.
+            merge_policy: How inserts update existing documents.
 
         """
 
-        self.es_storage = CNElasticStorage(uri, timeout=timeout)
+        self.es_storage = CNElasticStorage(
+            uri, timeout=timeout, merge_policy=merge_policy
+        )
         self.uri = uri
         self.index_name = index_name
 
+        self.name_index = name_index
+        self.fallback_timeout = fallback_timeout
+        self._index_executor = (
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="name-index")
+            if name_index is not None
+            else None
+        )
+        self._name_index_changed = False
+
+        # set when the server starts
+        self.result_cache = None
+        self.write_buffer = None
+
         self.crawler = Crawler()
         self.crawler.add_invader(parse_title_from_html)
         self.crawler.add_side_effect(
             lambda cwl, x: log.info(f"Name `{x}` was crawled.")
         )
-        self.crawler.add_transformer(process_spacy)
+        # same version as of `FusedNormalizer(steps=["Spacy"])`
+        self.normalization_cache = NormalizationCache.from_env()
+        self.crawler.add_transformer(
+            self.normalization_cache.memoize(process_spacy, pipeline_version(["Spacy"]))
+        )
 
-    # noinspection PyProtectedMember
     async def __call__(self, company_name, crawling=True, *args, **kwargs):
+        """
+        Search for company name, results are cached if `result_cache` is set.
+
+        See `search`.
+
+        Args:
+            company_name: Company name to search for.
+            crawling: If True, crawl company web-site.
+            *args: Additional arguments.
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            Search results.
+        """
+
+        if self.result_cache is None:
+            return await self.search(company_name, crawling)
+
+        start = time.perf_counter()
+        version, results = await self.result_cache.get(company_name)
+        hit = results is not None
+
+        if not hit:
+            results = await self.search(company_name, crawling)
+            await self.result_cache.set(
+                company_name, version, results, final=not crawling
+            )
+
+        await self.result_cache.record(hit, time.perf_counter() - start)
+        return results
+
+    # noinspection PyProtectedMember
+    async def search(self, company_name, crawling=True):
         """
         Search for company name in ES.
         If no results found, search company web-site, crawl it
@@ -110,8 +191,6 @@ class CNSearcher:
         Args:
             company_name: Company name to search for.
             crawling: If True, crawl company web-site.
-            *args: Additional arguments.
-            **kwargs: Additional keyword arguments.
 
         Returns:
             Search results.
@@ -156,11 +235,95 @@ class CNSearcher:
             item.query_string = company_name
             results.append(item)
 
-            await self.es_storage.insert_data(self.index_name, item.asdict())
+            # the response does not wait for ES if writes are buffered
+            if self.write_buffer is not None:
+                self.write_buffer.add(item.asdict())
+            else:
+                await self.es_storage.insert_data(self.index_name, item.asdict())
+                await self.on_insert(item.normalized_name)
 
         return search_response_from_crawler(company_name, results)
 
+    async def on_insert(self, *normalized_names):
+        """
+        Update the local index and invalidate cached results after inserts.
+
+        Args:
+            *normalized_names: Normalized company names.
+
+        Returns:
+            None.
+        """
+
+        names = [name for name in normalized_names if name]
+
+        if self.name_index is not None and names:
+            await self._run_in_index_thread(self.name_index.add, names)
+            self._name_index_changed = True
+
+        if self.result_cache is not None and normalized_names:
+            await self.result_cache.invalidate()
+
     async def _make_request(self, query):
+        """
+        Make search request to ES or to the local index if ES is slow.
+
+        Args:
+            query: Query string.
+
+        Returns:
+            Search results.
+        """
+
+        if self.name_index is None:
+            return await self._search_elastic(query)
+
+        try:
+            return await asyncio.wait_for(
+                self._search_elastic(query), timeout=self.fallback_timeout
+            )
+        except asyncio.TimeoutError:
+            log.warning(f"ES timed out, searching `{query}` in the local index.")
+
+        [(indices, _)] = await self._run_in_index_thread(
+            self.name_index.search, [query], 10
+        )
+        return search_response_from_index(
+            query, [self.name_index.names[i] for i in indices]
+        )
+
+    async def save_name_index(self, path):
+        """
+        Save the local index if names were inserted since it was loaded.
+
+        The index is written to a temporary file and renamed, so it is
+        never read half-written. Each server worker has its own index:
+        with several workers the one of the last stopped worker is kept,
+        names inserted by the others are added by the next offline build.
+
+        Args:
+            path: Path of the `.npz` file.
+
+        Returns:
+            None.
+        """
+
+        if self.name_index is None or not self._name_index_changed:
+            return
+
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        await self._run_in_index_thread(self.name_index.save, tmp)
+        os.replace(tmp, path)
+        self._name_index_changed = False
+        log.info(f"Saved {len(self.name_index.names)} names to {path}")
+
+    async def _run_in_index_thread(self, func, *args):
+        """Call a method of `name_index` off the event loop."""
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._index_executor, func, *args)
+
+    async def _search_elastic(self, query):
         """
         Make search request to ES.
         Search occurs across multiple fields, such as `company_name`,
@@ -173,24 +336,18 @@ class CNSearcher:
             Search results.
         """
 
-        do = partial(
-            self.es_storage.search_data,
+        # one request across all fields instead of one per field,
+        # as many hits as the per-field requests returned
+        results = await self.es_storage.search_fields(
             index_name=self.index_name,
+            target_fields=self.TARGET_FIELDS,
             query_string=query,
+            size=10 * len(self.TARGET_FIELDS),
         )
 
-        final_ = {"query": {"query_string": query, "matches": {}}}
-        results = [await do(target_field=field) for field in self.TARGET_FIELDS]
-
         log.info(json.dumps(results, indent=4))
 
-        matches = merge_matches([result["query"]["matches"] for result in results])
-
-        log.info(f"After merge: {matches}")
-
-        final_["query"]["matches"] = matches
-
-        return final_
+        return results
 
     async def close(self):
         """
@@ -202,5 +359,8 @@ class CNSearcher:
 
         await self.es_storage.close()
 
+        if self._index_executor is not None:
+            self._index_executor.shutdown(wait=False)
+
     async def is_ready(self):
         return await self.es_storage.ping()
@@ -1,22 +1,48 @@
+import asyncio
 import json
 import logging
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterable, List, Sequence
 
 from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import async_streaming_bulk
 
 from gateway.search_engine.schemas import (
     Fuzziness,
+    MergePolicy,
+    document_id,
     elastic_match_fuzzy,
+    elastic_multi_match_fuzzy,
     elastic_relevant_response,
+    elastic_upsert,
 )
 
 log = logging.getLogger(__name__)
 
+SEARCH_FIELDS = ("normalized_name", "query_string", "company_name", "company_url")
+
+# Retries of upserts of a document updated concurrently.
+_RETRY_ON_CONFLICT = 3
+
 
 class CNElasticStorage:
-    def __init__(self, uri: str, timeout=10):
+    """
+    ES storage of companies.
+
+    Documents are keyed by `document_id` of their normalized names and
+    written as upserts, so a company is stored once however many times
+    it is inserted, see `elastic_upsert` for merge policies.
+
+    Args:
+        uri: ES URI.
+        timeout: Request timeout.
+        merge_policy: How inserts update existing documents:
+         "none", "fill" or "overwrite".
+    """
+
+    def __init__(self, uri: str, timeout=10, merge_policy: MergePolicy = "fill"):
         self.es_client = AsyncElasticsearch([uri], timeout=timeout)
+        self.merge_policy = merge_policy
 
     async def create_index(self, index_name: str, force=False):
         """
@@ -46,36 +72,92 @@ class CNElasticStorage:
         else:
             log.info(f"Index {index_name} already exists.")
 
-    async def insert_data(self, index_name: str, data: Dict, check_exists=False):
+    async def insert_data(self, index_name: str, data: Dict):
         """
-        Insert data into an ES index.
+        Insert data into an ES index, or merge it into the existing document.
 
         Args:
             index_name (str): Name of the index.
             data (Dict): Data to be inserted.
-            check_exists (bool): Check if the data already exists.
 
         Returns:
             None
         """
 
-        log.info(f"Trying to insert data into ES {data}")
+        log.info(f"Upserting data into index {index_name}: {data}")
 
-        if check_exists:
-            resp = await self.search_data(
-                index_name=index_name,
-                target_field="normalized_name",
-                query_string=data["normalized_name"],
-                fuzziness="0",
-            )
+        await self.es_client.update(  # type: ignore
+            index=index_name,
+            id=document_id(data["normalized_name"]),
+            body=elastic_upsert(data, self.merge_policy),
+            retry_on_conflict=_RETRY_ON_CONFLICT,
+        )
 
-            if resp["query"]["matches"]:
-                log.info(f"Data already exists in ES {data}")
-                return
+    async def insert_bulk(
+        self,
+        index_name: str,
+        items: Iterable[Dict],
+        chunk_size: int = 500,
+        concurrency: int = 4,
+    ) -> List[Dict]:
+        """
+        Insert data into an ES index with bulk requests, see `insert_data`.
+
+        Args:
+            index_name (str): Name of the index.
+            items (Iterable[Dict]): Data to be inserted.
+            chunk_size (int): Number of items in a bulk request.
+            concurrency (int): Max number of bulk requests in flight.
 
-        log.info(f"Inserting data into index {index_name}")
+        Returns:
+            List[Dict]: Result of each item, in order: `ok`, `status`
+            and `error` (None if inserted).
+        """
 
-        await self.es_client.index(index=index_name, body=data)  # type: ignore
+        items = list(items)
+        results: List[Dict] = [{} for _ in items]
+        semaphore = asyncio.Semaphore(concurrency)
+
+        log.info(f"Inserting {len(items)} items into index {index_name}")
+
+        async def send(start):
+            actions = [
+                {
+                    "_op_type": "update",
+                    "_index": index_name,
+                    "_id": document_id(data["normalized_name"]),
+                    "retry_on_conflict": _RETRY_ON_CONFLICT,
+                    **elastic_upsert(data, self.merge_policy),
+                }
+                for data in items[start : start + chunk_size]
+            ]
+
+            async with semaphore:
+                # results come in order of actions, failed ones included
+                position = start
+                try:
+                    async for ok, info in async_streaming_bulk(
+                        self.es_client,
+                        actions,
+                        chunk_size=chunk_size,
+                        raise_on_error=False,
+                        raise_on_exception=False,
+                    ):
+                        [result] = info.values()
+                        results[position] = {
+                            "ok": ok,
+                            "status": result.get("status"),
+                            "error": None if ok else result.get("error"),
+                        }
+                        position += 1
+                except Exception as e:
+                    # e.g. connection errors, which are not reported per item
+                    log.error(f"Bulk insert failed: {e}")
+                    for i in range(position, start + len(actions)):
+                        results[i] = {"ok": False, "status": None, "error": str(e)}
+
+        await asyncio.gather(*(send(i) for i in range(0, len(items), chunk_size)))
+        return results
 
     async def search_data(
         self,
@@ -99,12 +181,7 @@ class CNElasticStorage:
         """
 
         assert fuzziness in ("0", "1", "2"), "Fuzziness must be 0, 1 or 2"
-        assert target_field in (
-            "normalized_name",
-            "query_string",
-            "company_name",
-            "company_url",
-        ), (
+        assert target_field in SEARCH_FIELDS, (
             "Target field must be one of"
             " normalized_name, query_string,"
             " company_name or company_url"
@@ -127,6 +204,59 @@ class CNElasticStorage:
 
         return relevant
 
+    async def search_fields(
+        self,
+        *,
+        index_name: str,
+        target_fields: Sequence[str],
+        query_string: str,
+        fuzziness: Fuzziness = "1",
+        size: int = 10,
+    ) -> Dict:
+        """
+        Search data in several fields of an ES index in one request.
+
+        Hits are scored by their best matching field and deduplicated
+        by ES, matches of the same name are merged in one pass.
+
+        Args:
+            index_name (str): Name of the index.
+            target_fields (Sequence[str]): Fields to search in.
+            query_string (str): Query string.
+            fuzziness (str): Fuzziness level.
+            size (int): Max number of hits.
+
+        Returns:
+            Dict: Search response.
+        """
+
+        assert fuzziness in ("0", "1", "2"), "Fuzziness must be 0, 1 or 2"
+        assert set(target_fields) <= set(SEARCH_FIELDS), (
+            "Target fields must be some of"
+            " normalized_name, query_string,"
+            " company_name or company_url"
+        )
+
+        log.info(f"Searching data from index {index_name}")
+
+        res = await self.es_client.search(  # type: ignore
+            index=index_name,
+            body=elastic_multi_match_fuzzy(
+                query=query_string,
+                fields=target_fields,
+                fuzziness=fuzziness,
+                size=size,
+            ),
+        )
+
+        log.info(f"Search results: {res}")
+
+        relevant = elastic_relevant_response(query_string, res["hits"]["hits"])
+
+        log.info(f"Relevant results: {json.dumps(relevant, indent=4)}")
+
+        return relevant
+
     async def ping(self):
         try:
             await self.es_client.ping()
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+from typing import Dict, Optional, Tuple
+
+__all__ = [
+    "SearchCache",
+]
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query for cache keys.
+
+    ES and token set ratio ignore case and extra whitespace, so such
+    queries share results.
+
+    Args:
+        query: Query string.
+
+    Returns:
+        Normalized query.
+    """
+
+    return " ".join(query.lower().split())
+
+
+class SearchCache:
+    """
+    Cache of search results in Redis.
+
+    Keys are made of the index name, the index version and the
+    normalized query. Inserts bump the version, so results cached
+    before an insert are never served again and expire by TTL.
+
+    Empty results are cached only if they are final, i.e. crawling
+    is off, for ``negative_ttl`` seconds.
+
+    Args:
+        redis: aioredis client with ``decode_responses=True``.
+        index_name: ES index name.
+        ttl: TTL of results in seconds, 0 disables the cache.
+        negative_ttl: TTL of empty results in seconds, 0 disables
+         negative caching.
+        prefix: Prefix of Redis keys.
+
+    Methods:
+        get: Get cached results of a query.
+        set: Cache results of a query.
+        invalidate: Bump the index version.
+        record: Record a search in metrics.
+        metrics: Get hit rate and latency.
+    """
+
+    def __init__(
+        self, redis, index_name: str, ttl=300, negative_ttl=60, prefix="cmnsim:search"
+    ):
+        self.redis = redis
+        self.index_name = index_name
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.prefix = f"{prefix}:{index_name}"
+
+    @classmethod
+    def from_env(cls, redis, index_name: str) -> "SearchCache":
+        """
+        Make a cache configured by environment variables.
+
+        ``SEARCH_CACHE_TTL`` and ``SEARCH_CACHE_NEGATIVE_TTL`` are TTLs
+        of results and of empty results in seconds.
+
+        Args:
+            redis: aioredis client.
+            index_name: ES index name.
+
+        Returns:
+            Cache instance.
+        """
+
+        return cls(
+            redis,
+            index_name,
+            ttl=int(os.getenv("SEARCH_CACHE_TTL", 300)),
+            negative_ttl=int(os.getenv("SEARCH_CACHE_NEGATIVE_TTL", 60)),
+        )
+
+    def _key(self, query: str, version: str) -> str:
+        digest = hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()
+        return f"{self.prefix}:{version}:{digest}"
+
+    async def get(self, query: str) -> Tuple[str, Optional[Dict]]:
+        """
+        Get cached results of a query.
+
+        Args:
+            query: Query string.
+
+        Returns:
+            Index version and results, None if not cached. Pass the
+            version to `set`, so results computed during an insert are
+            not cached under the new version.
+        """
+
+        version = await self.redis.get(f"{self.prefix}:version") or "0"
+        if not self.ttl:
+            return version, None
+
+        cached = await self.redis.get(self._key(query, version))
+        if cached is None:
+            return version, None
+
+        results = json.loads(cached)
+        # the cached query may differ in case and spaces
+        results["query"]["query_string"] = query
+        return version, results
+
+    async def set(self, query: str, version: str, results: Dict, final=True):
+        """
+        Cache results of a query.
+
+        Args:
+            query: Query string.
+            version: Index version returned by `get`.
+            results: Search results.
+            final: Whether empty results are final (crawling is off).
+
+        Returns:
+            None
+        """
+
+        ttl = self.ttl if results["query"]["matches"] else self.negative_ttl
+        if not self.ttl or not ttl or not (results["query"]["matches"] or final):
+            return
+
+        await self.redis.set(self._key(query, version), json.dumps(results), ex=ttl)
+
+    async def invalidate(self):
+        """
+        Bump the index version after an insert.
+
+        Returns:
+            None
+        """
+
+        await self.redis.incr(f"{self.prefix}:version")
+
+    async def record(self, hit: bool, seconds: float):
+        """
+        Record a search in metrics.
+
+        Args:
+            hit: Whether results were served from the cache.
+            seconds: Latency of the search.
+
+        Returns:
+            None
+        """
+
+        kind = "hits" if hit else "misses"
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hincrby(f"{self.prefix}:metrics", kind, 1)
+        pipe.hincrbyfloat(f"{self.prefix}:metrics", f"{kind}_seconds", seconds)
+        await pipe.execute()
+
+    async def metrics(self) -> Dict:
+        """
+        Get hit rate and latency of all gateway workers.
+
+        Returns:
+            Dict with number of hits and misses, hit rate and mean
+            latency of hits and misses in milliseconds.
+        """
+
+        raw = await self.redis.hgetall(f"{self.prefix}:metrics")
+        hits, misses = int(raw.get("hits", 0)), int(raw.get("misses", 0))
+
+        def latency(kind, count):
+            return 1000 * float(raw.get(f"{kind}_seconds", 0)) / count if count else 0.0
+
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "hit_latency_ms": latency("hits", hits),
+            "miss_latency_ms": latency("misses", misses),
+        }
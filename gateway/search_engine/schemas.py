@@ -1,11 +1,84 @@
-from typing import Any, Dict, List, Literal
+import hashlib
+from typing import TYPE_CHECKING, Any, Dict, List, Literal, Sequence
 
 from fuzzywuzzy import fuzz
 
-from gateway.crawling.crawler import Item
+if TYPE_CHECKING:
+    from gateway.crawling.crawler import Item
 
 ElasticRequest = Dict[str, Any]
 Fuzziness = Literal["0", "1", "2", "AUTO"]
+MergePolicy = Literal["none", "fill", "overwrite"]
+
+MERGE_POLICIES = ("none", "fill", "overwrite")
+
+# Fields of an existing document, which are updated by upserts.
+MERGE_FIELDS = ("company_url", "query_string")
+
+# Sets merged fields of an existing document, makes no write if nothing changed.
+_UPSERT_SCRIPT = """
+boolean changed = false;
+for (entry in params.doc.entrySet()) {
+    def old = ctx._source[entry.getKey()];
+    if ((params.overwrite || old == null || old == '') && old != entry.getValue()) {
+        ctx._source[entry.getKey()] = entry.getValue();
+        changed = true;
+    }
+}
+if (!changed) {
+    ctx.op = 'noop';
+}
+"""
+
+
+def document_id(normalized_name: str) -> str:
+    """
+    Get ES document ID of a company.
+
+    Args:
+        normalized_name: Normalized company name.
+
+    Returns:
+        Hex digest of the name with case and extra spaces ignored.
+    """
+
+    key = " ".join(normalized_name.lower().split())
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def elastic_upsert(data: Dict, merge_policy: MergePolicy = "fill") -> ElasticRequest:
+    """
+    Upsert a company document.
+
+    A new document is created as is. For an existing one non-empty
+    `MERGE_FIELDS` of `data` are merged by the policy: "none" keeps
+    the document, "fill" sets empty fields, "overwrite" sets all of
+    them.
+
+    Args:
+        data: Document.
+        merge_policy: Merge policy.
+
+    Returns:
+        ElasticRequest: Body of an update request.
+    """
+
+    assert (
+        merge_policy in MERGE_POLICIES
+    ), f"Merge policy must be one of {MERGE_POLICIES}"
+
+    doc = {}
+    if merge_policy != "none":
+        doc = {field: data[field] for field in MERGE_FIELDS if data.get(field)}
+
+    return {
+        "script": {
+            "source": _UPSERT_SCRIPT,
+            "lang": "painless",
+            "params": {"doc": doc, "overwrite": merge_policy == "overwrite"},
+        },
+        "upsert": data,
+    }
 
 
 def elastic_match_fuzzy(
@@ -38,7 +111,42 @@ def elastic_match_fuzzy(
     }
 
 
-def search_response_from_crawler(query_string, items: List[Item]) -> Dict:
+def elastic_multi_match_fuzzy(
+    *,
+    query: str,
+    fields: Sequence[str],
+    fuzziness: Fuzziness = "1",
+    size: int = 10,
+) -> ElasticRequest:
+    """
+    Match query with fuzziness across several fields in one request.
+
+    A hit is scored by its best matching field.
+
+    Args:
+        query: Query string.
+        fields: Fields to match.
+        fuzziness: Fuzziness level.
+        size: Max number of hits.
+
+    Returns:
+        ElasticRequest: Elastic request.
+    """
+
+    return {
+        "size": size,
+        "query": {
+            "multi_match": {
+                "query": query,
+                "fields": list(fields),
+                "type": "best_fields",
+                "fuzziness": fuzziness,
+            }
+        },
+    }
+
+
+def search_response_from_crawler(query_string, items: List["Item"]) -> Dict:
     """
     Get search response from Items list.
 
@@ -67,38 +175,72 @@ def search_response_from_crawler(query_string, items: List[Item]) -> Dict:
     }
 
 
-def elastic_relevant_response(query_string: str, hits: list, threshold=0.01) -> Dict:
+def search_response_from_index(query_string, names: List[str], threshold=0.3) -> Dict:
     """
-    Get relevant response from ES hits.
+    Get search response from names found in the local index.
+
+    Only normalized names are indexed locally, so company name and URL
+    are empty.
 
     Args:
         query_string: Query string.
-        hits: List of hits.
-        threshold: Threshold value.
+        names: Normalized names.
+        threshold: Min token set ratio of a match.
 
     Returns:
         Dict: Search response.
     """
 
-    def get_shorter_name(hit):
-        source: Dict[str, str] = hit["_source"]
-        return min((x for x in source.values() if x != ""), key=len)
+    scores = {name: fuzz.token_set_ratio(query_string, name) / 100 for name in names}
 
     return {
         "query": {
             "query_string": query_string,
             "matches": {
-                get_shorter_name(hit): {
-                    "score": fuzz.token_set_ratio(query_string, get_shorter_name(hit))
-                    / 100,
-                    "normalized_name": hit["_source"]["normalized_name"],
-                    "company_name": hit["_source"]["company_name"],
-                    "company_url": hit["_source"]["company_url"],
+                name: {
+                    "score": score,
+                    "normalized_name": name,
+                    "company_name": "",
+                    "company_url": "",
                 }
-                for hit in hits
-                if hit["_score"] > threshold
-                and fuzz.token_set_ratio(query_string, get_shorter_name(hit)) / 100
-                > 0.3
+                for name, score in scores.items()
+                if score > threshold
             },
         }
     }
+
+
+def elastic_relevant_response(query_string: str, hits: list, threshold=0.01) -> Dict:
+    """
+    Get relevant response from ES hits.
+
+    Args:
+        query_string: Query string.
+        hits: List of hits.
+        threshold: Threshold value.
+
+    Returns:
+        Dict: Search response.
+    """
+
+    def get_shorter_name(hit):
+        source: Dict[str, str] = hit["_source"]
+        return min((x for x in source.values() if x != ""), key=len)
+
+    # hits come best first, the first hit of a name is kept
+    matches: Dict[str, Dict] = {}
+    for hit in hits:
+        name = get_shorter_name(hit)
+        if name in matches or hit["_score"] <= threshold:
+            continue
+
+        score = fuzz.token_set_ratio(query_string, name) / 100
+        if score > 0.3:
+            matches[name] = {
+                "score": score,
+                "normalized_name": hit["_source"]["normalized_name"],
+                "company_name": hit["_source"]["company_name"],
+                "company_url": hit["_source"]["company_url"],
+            }
+
+    return {"query": {"query_string": query_string, "matches": matches}}
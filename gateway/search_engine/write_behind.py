@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Optional
+
+log = logging.getLogger(__name__)
+
+__all__ = [
+    "WriteBehindBuffer",
+]
+
+
+class WriteBehindBuffer:
+    """
+    Buffer of documents written to ES in the background.
+
+    Documents are written with `CNElasticStorage.insert_bulk` when
+    ``max_size`` of them are buffered, every ``max_delay`` seconds and
+    on `close`. Until then they are not searchable.
+
+    Documents which failed to be written for a transient reason (the
+    bulk request raised, ES did not answer, returned 429 or 5xx) are
+    put back in front of the buffer. Background flushes then back off:
+    the n-th failure in a row pauses them for ``max_delay * 2**(n-1)``
+    seconds, at most ``max_backoff``. The buffer keeps at most
+    ``max_buffer`` documents, the oldest ones are dropped and logged.
+
+    Args:
+        storage: `CNElasticStorage`.
+        index_name: ES index name.
+        max_size: Number of buffered documents which triggers a flush.
+        max_delay: Max seconds a document waits for a flush.
+        on_flush: Coroutine function called with normalized names of
+         written documents.
+        max_buffer: Max number of buffered documents, ``10 * max_size``
+         by default.
+        max_backoff: Max seconds background flushes pause after failures.
+
+    Methods:
+        start: Start periodic flushes.
+        add: Buffer a document.
+        flush: Write buffered documents.
+        close: Stop periodic flushes and write the rest.
+    """
+
+    def __init__(
+        self,
+        storage,
+        index_name: str,
+        max_size=100,
+        max_delay=5.0,
+        on_flush: Optional[Callable[..., Awaitable]] = None,
+        max_buffer: Optional[int] = None,
+        max_backoff=60.0,
+    ):
+        self.storage = storage
+        self.index_name = index_name
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.on_flush = on_flush
+        self.max_buffer = 10 * max_size if max_buffer is None else max_buffer
+        self.max_backoff = max_backoff
+
+        self._items: List[Dict] = []
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._flushes: List[asyncio.Task] = []
+        self._failures = 0
+        self._retry_at = 0.0
+
+    @classmethod
+    def from_env(cls, storage, index_name: str, on_flush=None) -> "WriteBehindBuffer":
+        """
+        Make a buffer configured by environment variables.
+
+        ``WRITE_BEHIND_SIZE`` is the number of documents which triggers
+        a flush, ``WRITE_BEHIND_DELAY`` is the max delay in seconds,
+        ``WRITE_BEHIND_MAX_BUFFER`` is the max number of buffered
+        documents.
+
+        Args:
+            storage: `CNElasticStorage`.
+            index_name: ES index name.
+            on_flush: Coroutine function called with written names.
+
+        Returns:
+            Buffer instance.
+        """
+
+        return cls(
+            storage,
+            index_name,
+            max_size=int(os.getenv("WRITE_BEHIND_SIZE", 100)),
+            max_delay=float(os.getenv("WRITE_BEHIND_DELAY", 5.0)),
+            on_flush=on_flush,
+            max_buffer=(
+                int(os.environ["WRITE_BEHIND_MAX_BUFFER"])
+                if "WRITE_BEHIND_MAX_BUFFER" in os.environ
+                else None
+            ),
+        )
+
+    def start(self):
+        """
+        Start periodic flushes, must be called in a running event loop.
+
+        Returns:
+            None
+        """
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.max_delay)
+            await self._flush_logged()
+
+    def _backing_off(self) -> bool:
+        """Whether background flushes are paused after failures."""
+        return asyncio.get_running_loop().time() < self._retry_at
+
+    async def _flush_logged(self, force=False):
+        """Flush in the background, errors are logged."""
+
+        if not force and self._backing_off():
+            return
+
+        try:
+            await self.flush()
+        except Exception as e:
+            log.error(f"Write-behind flush failed: {e}")
+
+    def add(self, item: Dict):
+        """
+        Buffer a document, flush in the background if the buffer is full.
+
+        Args:
+            item: Document.
+
+        Returns:
+            None
+        """
+
+        self._items.append(item)
+        self._drop_oldest()
+
+        if len(self._items) >= self.max_size and not self._backing_off():
+            task = asyncio.create_task(self._flush_logged())
+            self._flushes.append(task)
+            task.add_done_callback(self._flushes.remove)
+
+    async def flush(self):
+        """
+        Write buffered documents.
+
+        Documents which failed for a transient reason are put back into
+        the buffer, the rest of failed ones are logged and dropped.
+
+        Returns:
+            None
+
+        Raises:
+            Exception: If the bulk request raised or was cancelled,
+             documents are put back into the buffer.
+        """
+
+        async with self._lock:
+            items, self._items = self._items, []
+            if not items:
+                return
+
+            try:
+                results = await self.storage.insert_bulk(self.index_name, items)
+            except BaseException:
+                # also on cancellation, e.g. by `close`
+                self._requeue(items)
+                raise
+
+        written, retry = [], []
+        for item, result in zip(items, results):
+            if result["ok"]:
+                written.append(item["normalized_name"])
+            elif _is_transient(result["status"]):
+                retry.append(item)
+            else:
+                log.error(f"Failed to write {item}: {result['error']}")
+
+        log.info(f"Written {len(written)} of {len(items)} buffered documents")
+
+        if retry:
+            log.warning(f"{len(retry)} documents were not written, will retry")
+            self._requeue(retry)
+        else:
+            self._failures, self._retry_at = 0, 0.0
+
+        if self.on_flush is not None and written:
+            await self.on_flush(*written)
+
+    def _requeue(self, items: List[Dict]):
+        """Put failed documents back in front of the buffer and back off."""
+
+        self._items[:0] = items
+        self._drop_oldest()
+
+        self._failures += 1
+        backoff = min(self.max_delay * 2 ** (self._failures - 1), self.max_backoff)
+        self._retry_at = asyncio.get_running_loop().time() + backoff
+
+    def _drop_oldest(self):
+        """Drop the oldest documents above `max_buffer`."""
+
+        excess = len(self._items) - self.max_buffer
+        if excess > 0:
+            log.error(f"Write-behind buffer is full, dropped {self._items[:excess]}")
+            del self._items[:excess]
+
+    async def close(self):
+        """
+        Stop periodic flushes and write the rest.
+
+        Documents which still fail to be written are logged and dropped.
+
+        Returns:
+            None
+        """
+
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+        await self._flush_logged(force=True)
+
+        if self._items:
+            log.error(f"Dropped {len(self._items)} unwritten documents on close")
+            self._items = []
+
+
+def _is_transient(status: Optional[int]) -> bool:
+    """Whether a document may be written on retry: no answer, 429 or 5xx."""
+    return status is None or status == 429 or status >= 500
@@ -5,7 +5,11 @@ from pathlib import Path
 
 import aioredis
 
+from cmnsim.misc.spacy_wrapper import get_nlp
+from cmnsim.name_index import NameIndex
 from gateway.search_engine.cnsearcher import CNSearcher
+from gateway.search_engine.result_cache import SearchCache
+from gateway.search_engine.write_behind import WriteBehindBuffer
 
 log = logging.getLogger(__name__)
 
@@ -20,7 +24,17 @@ def setup(app):
         log.error("Elasticsearch URI and index must be specified")
         exit(0)
 
-    app.ctx.cn_searcher = CNSearcher(elastic_url, elastic_index)
+    # optional local index of normalized names, used when ES is slow
+    name_index_path = os.getenv("NAME_INDEX_PATH")
+    name_index = NameIndex.load(name_index_path) if name_index_path else None
+
+    app.ctx.cn_searcher = CNSearcher(
+        elastic_url,
+        elastic_index,
+        name_index=name_index,
+        fallback_timeout=float(os.getenv("ELASTIC_FALLBACK_TIMEOUT", 1.0)),
+        merge_policy=os.getenv("ELASTIC_MERGE_POLICY", "fill"),
+    )
 
     app.ctx.es_url = elastic_url
     app.ctx.es_index = elastic_index
@@ -36,12 +50,37 @@ def setup(app):
         if create_index:
             await app.ctx.cn_searcher.es_storage.create_index(elastic_index)
 
+        # load the crawler's spacy model before accepting traffic
+        get_nlp("xx_ent_wiki_sm")
+
         app_.ctx.redis = await aioredis.from_url(
             app_.config["redis"], decode_responses=True
         )
+        app_.ctx.cn_searcher.result_cache = SearchCache.from_env(
+            app_.ctx.redis, elastic_index
+        )
+
+        # crawled items are written to ES in bulk in the background
+        if os.getenv("WRITE_BEHIND", "true").lower() == "true":
+            searcher = app_.ctx.cn_searcher
+            searcher.write_buffer = WriteBehindBuffer.from_env(
+                searcher.es_storage, elastic_index, on_flush=searcher.on_insert
+            )
+            searcher.write_buffer.start()
 
         # UNSAFE: only for testing
         with open(Path(__file__).parent.joinpath("api_keys.txt")) as f:
             for line in f:
                 await app_.ctx.redis.set(line.strip(), 1)
         # UNSAFE
+
+    @app.listener("before_server_stop")
+    async def server_stop(app_, loop):
+        """Write buffered items and inserted names before shutdown."""
+
+        if app_.ctx.cn_searcher.write_buffer is not None:
+            await app_.ctx.cn_searcher.write_buffer.close()
+
+        # names inserted since the index was loaded survive restarts
+        if name_index_path:
+            await app_.ctx.cn_searcher.save_name_index(name_index_path)
@@ -0,0 +1,113 @@
+from json import loads
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+__all__ = [
+    "BulkTooLarge",
+    "insert_items",
+    "parse_bulk_body",
+]
+
+
+class BulkTooLarge(ValueError):
+    """A bulk request has more items than allowed."""
+
+
+def parse_bulk_body(body: bytes, max_items: Optional[int] = None) -> List[Dict]:
+    """
+    Parse items of a bulk request: a JSON array or NDJSON.
+
+    Args:
+        body: Request body.
+        max_items: Max number of items, None for no limit.
+
+    Returns:
+        List of items.
+
+    Raises:
+        BulkTooLarge: If there are more than ``max_items`` items.
+        ValueError: If the body is not valid JSON array or NDJSON or
+         has no items.
+    """
+
+    try:
+        text = body.decode("utf-8").strip()
+    except UnicodeDecodeError as e:
+        raise ValueError(f"Body must be UTF-8: {e}") from e
+
+    if text.startswith("["):
+        items = loads(text)
+    else:
+        items = []
+        for number, line in enumerate(text.splitlines(), 1):
+            if line.strip():
+                try:
+                    items.append(loads(line))
+                except ValueError as e:
+                    raise ValueError(f"Line {number}: {e}") from e
+
+                if max_items is not None and len(items) > max_items:
+                    break
+
+    if not isinstance(items, list):
+        raise ValueError("Body must be a JSON array or NDJSON")
+    if not items:
+        raise ValueError("Body has no items")
+    if max_items is not None and len(items) > max_items:
+        raise BulkTooLarge(f"At most {max_items} items are allowed in a request")
+
+    return items
+
+
+async def insert_items(
+    storage,
+    index_name: str,
+    raw_items: List[Any],
+    model,
+    chunk_size: int = 500,
+    concurrency: int = 4,
+) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """
+    Validate items of a bulk request and insert the valid ones.
+
+    Args:
+        storage: `CNElasticStorage`.
+        index_name: ES index name.
+        raw_items: Parsed items, see `parse_bulk_body`.
+        model: Pydantic model of an item.
+        chunk_size: Number of items in a bulk request.
+        concurrency: Max number of bulk requests in flight.
+
+    Returns:
+        Normalized names of inserted items and errors of the rest:
+        dicts with ``index`` of the item, ``status`` and ``error``,
+        in order of items.
+    """
+
+    items: List[Tuple[int, Dict]] = []
+    errors: List[Dict[str, Any]] = []
+    for i, raw_item in enumerate(raw_items):
+        try:
+            items.append((i, model(**raw_item).dict()))
+        except (TypeError, ValidationError) as e:
+            errors.append({"index": i, "status": 400, "error": str(e)})
+
+    results = await storage.insert_bulk(
+        index_name,
+        [data for _, data in items],
+        chunk_size=chunk_size,
+        concurrency=concurrency,
+    )
+
+    inserted = []
+    for (i, data), result in zip(items, results):
+        if result["ok"]:
+            inserted.append(data["normalized_name"])
+        else:
+            errors.append(
+                {"index": i, "status": result["status"], "error": result["error"]}
+            )
+
+    errors.sort(key=lambda error: error["index"])
+    return inserted, errors
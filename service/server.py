@@ -9,7 +9,8 @@ from sanic import Sanic
 from sanic.response import redirect
 from service.utils.j2 import setup_jinja
 
-from cmnsim.preprocessing import FullTransformersPipeline
+from cmnsim.cache import NormalizationCache
+from cmnsim.preprocessing import FusedNormalizer, default_steps
 
 app = Sanic("cmnsim")
 app.config["GATEWAY_URI"] = os.getenv("GATEWAY_URI", "http://127.0.0.1:5000")
@@ -25,6 +26,17 @@ logging.basicConfig(
 
 log = logging.getLogger(__name__)
 
+normalizer = FusedNormalizer(
+    steps=default_steps(fast_path=os.getenv("CMNSIM_SPACY_FAST_PATH") == "1"),
+    cache=NormalizationCache.from_env(),
+)
+
+
+@app.listener("before_server_start")
+async def warmup(app_, loop):
+    """Load preprocessing models before accepting traffic."""
+    normalizer.warmup()
+
 
 @app.route("/")
 async def index(request):
@@ -42,7 +54,7 @@ async def search_name(request, query):
     uri = f"{app.config['GATEWAY_URI']}/search"
     query = unquote(query)
 
-    [query] = FullTransformersPipeline().transform([query])
+    query = normalizer.normalize(query)
 
     req = {"query": str(query)}
     headers = {"X-API-KEY": request.app.config["GATEWAY_API_KEY"]}
@@ -0,0 +1,17 @@
+from benchmarks.suite import compare, load_pairs, run_suite, scale_names
+
+
+def test_scale_names_is_seeded():
+    names = load_pairs()["name_1"]
+
+    assert list(scale_names(names, 50, seed=1)) == list(scale_names(names, 50, seed=1))
+    assert len(scale_names(names, 50)) == 50
+
+
+def test_run_suite():
+    report = run_suite([20], [20], spacy=False, echo=lambda _: None)
+    names = {result["name"] for result in report["results"]}
+
+    assert {"FusedNormalizer", "CNFuzzyClassifier.predict_proba"} <= names
+    assert all(result["peak_memory_bytes"] > 0 for result in report["results"])
+    assert "FusedNormalizer" in compare(report, report)
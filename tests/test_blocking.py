@@ -0,0 +1,42 @@
+import numpy.testing as npt
+
+from benchmarks.suite import load_pairs
+from cmnsim.blocking import BlockingIndex, _ngrams, blocking_report
+
+NAMES = ["Big Pharma", "Pharma Big LLC", "Roga i Kopyta", "Brenntag", "Big Pharmacy"]
+
+
+def test_candidate_pairs():
+    index = BlockingIndex().fit(NAMES)
+
+    npt.assert_array_equal(index.candidate_pairs(), [[0, 1], [0, 4], [1, 4]])
+    npt.assert_array_equal(
+        BlockingIndex(chunk_size=2).fit(NAMES).candidate_pairs(),
+        index.candidate_pairs(),
+    )
+
+
+def test_query():
+    index = BlockingIndex().fit(NAMES)
+    candidates = index.query(["big pharma ltd", "unknown"])
+
+    npt.assert_array_equal(candidates[0], [0, 1, 4])
+    assert len(candidates[1]) == 0
+
+
+def test_ngrams_unicode():
+    assert "mül" in _ngrams("Müller GmbH", 3)
+    assert _ngrams("ООО «Рога и Копыта»", 3) == _ngrams("ооо рога и копыта", 3)
+
+    index = BlockingIndex().fit(
+        ["Société Générale", "Roga i Kopyta", "Societe Generale"]
+    )
+    npt.assert_array_equal(index.candidate_pairs(), [[0, 2]])
+
+
+def test_blocking_report():
+    report = blocking_report(load_pairs().head(200))
+
+    assert report["names"] > 0
+    assert report["candidate_pairs"] < report["all_pairs"]
+    assert report["recall"] > 0.8
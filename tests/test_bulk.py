@@ -0,0 +1,88 @@
+import asyncio
+import json
+
+import pytest
+from pydantic import BaseModel
+
+from gateway.utils.bulk import BulkTooLarge, insert_items, parse_bulk_body
+
+
+class Item(BaseModel):
+    company_name: str
+    normalized_name: str
+
+
+class StubStorage:
+    """`CNElasticStorage.insert_bulk` stub with a status per normalized name."""
+
+    def __init__(self, statuses=None):
+        self.statuses = statuses or {}
+        self.calls = []
+
+    async def insert_bulk(self, index_name, items, chunk_size, concurrency):
+        self.calls.append((index_name, items, chunk_size, concurrency))
+
+        results = []
+        for item in items:
+            status = self.statuses.get(item["normalized_name"], 201)
+            ok = status < 300
+            results.append({"ok": ok, "status": status, "error": None if ok else "x"})
+        return results
+
+
+def _item(name):
+    return {"company_name": name.capitalize(), "normalized_name": name}
+
+
+def test_parse_bulk_body():
+    items = [_item("a"), _item("b")]
+    array = json.dumps(items).encode()
+    ndjson = "\n\n".join(json.dumps(item) for item in items).encode()
+
+    assert parse_bulk_body(array) == items
+    assert parse_bulk_body(ndjson + b"\n") == items
+
+
+@pytest.mark.parametrize("body", [b"[{]", b"{}\n{oops}", b"\xff", b"", b" \n", b"[]"])
+def test_parse_bulk_body_invalid(body):
+    with pytest.raises(ValueError) as e:
+        parse_bulk_body(body)
+    assert not isinstance(e.value, BulkTooLarge)
+
+
+def test_parse_bulk_body_malformed_line():
+    with pytest.raises(ValueError, match="Line 2"):
+        parse_bulk_body(b'{"company_name": "A"}\n{oops}')
+
+
+def test_parse_bulk_body_too_large():
+    ndjson = b"\n".join(b"{}" for _ in range(4))
+
+    assert len(parse_bulk_body(ndjson, max_items=4)) == 4
+    with pytest.raises(BulkTooLarge):
+        parse_bulk_body(ndjson, max_items=3)
+    with pytest.raises(BulkTooLarge):
+        parse_bulk_body(b"[" + ndjson.replace(b"\n", b",") + b"]", max_items=3)
+
+
+def test_insert_items():
+    storage = StubStorage({"c": 409, "e": 429})
+    raw_items = [_item("a"), {"company_name": "B"}, _item("c"), "d", _item("e")]
+
+    inserted, errors = asyncio.run(
+        insert_items(storage, "test", raw_items, Item, chunk_size=2, concurrency=1)
+    )
+
+    assert inserted == ["a"]
+    assert [(error["index"], error["status"]) for error in errors] == [
+        (1, 400),
+        (2, 409),
+        (3, 400),
+        (4, 429),
+    ]
+
+    # only valid items are sent
+    [(index_name, items, chunk_size, concurrency)] = storage.calls
+    assert index_name == "test"
+    assert [item["normalized_name"] for item in items] == ["a", "c", "e"]
+    assert (chunk_size, concurrency) == (2, 1)
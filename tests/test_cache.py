@@ -0,0 +1,70 @@
+import numpy.testing as npt
+
+from cmnsim.cache import NormalizationCache
+from cmnsim.preprocessing import FusedNormalizer
+
+STEPS = ["NumbersEliminator", "NotWordsEliminator", "Lowercaser"]
+
+
+def test_lru_eviction():
+    cache = NormalizationCache(maxsize=2)
+    cache.set("v", "a", "1")
+    cache.set("v", "b", "2")
+    cache.get("v", "a")
+    cache.set("v", "c", "3")
+
+    assert cache.get("v", "a") == "1"
+    assert cache.get("v", "b") is None
+    assert cache.get("v", "c") == "3"
+    assert cache.stats()["memory_size"] == 2
+
+
+def test_counters():
+    cache = NormalizationCache()
+    cache.set("v", "a", "1")
+
+    assert cache.get_many("v", ["a", "a", "b"]) == {"a": "1"}
+    assert cache.hits == 1
+    assert cache.misses == 1
+    assert cache.stats()["hit_rate"] == 0.5
+
+
+def test_disk_tier(tmp_path):
+    path = tmp_path / "cache.db"
+    cache = NormalizationCache(path=path)
+    cache.set("v", "a", "1")
+    cache.close()
+
+    cache = NormalizationCache(path=path)
+    assert cache.get("v", "a") == "1"
+    assert cache.disk_hits == 1
+    assert cache.get("v", "a") == "1"
+    assert cache.disk_hits == 1
+
+
+def test_fused_normalizer_cache():
+    cache = NormalizationCache()
+    names = ['ООО "Рога и Копыта 123"', "Big Pharma 123", 'ООО "Рога и Копыта 123"']
+
+    normalizer = FusedNormalizer(steps=STEPS, cache=cache)
+    expected = FusedNormalizer(steps=STEPS).transform(names)
+
+    npt.assert_array_equal(normalizer.transform(names), expected)
+    assert cache.misses == 2
+
+    npt.assert_array_equal(normalizer.transform(names), expected)
+    assert cache.hits == 2
+    assert normalizer.normalize(names[1]) == expected[1]
+
+
+def test_version_invalidation():
+    cache = NormalizationCache()
+
+    FusedNormalizer(steps=STEPS, cache=cache).transform(["Big Pharma 123"])
+    result = FusedNormalizer(steps=STEPS[:-1], cache=cache).transform(
+        ["Big Pharma 123"]
+    )
+
+    npt.assert_array_equal(result, ["Big Pharma"])
+    assert cache.hits == 0
+    assert FusedNormalizer(steps=STEPS).version != FusedNormalizer().version
@@ -0,0 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy.testing as npt
+
+from benchmarks.suite import load_pairs
+from cmnsim.blocking import BlockingIndex
+from cmnsim.clustering import UnionFind, _imap_bounded, cluster_names, cluster_stream
+from cmnsim.fuzzy_clf import CNFuzzyClassifier
+from cmnsim.preprocessing import FusedNormalizer
+
+NAMES = ["big pharma", "roga", "pharma big", "big pharma", "brenntag", "roga"]
+
+
+def test_union_find():
+    sets = UnionFind(5)
+    sets.union_pairs([[3, 4], [1, 2], [2, 4]])
+
+    npt.assert_array_equal(sets.roots(), [0, 1, 1, 1, 1])
+    assert sets.find(3) == sets.find(1)
+
+
+def test_cluster_names():
+    clusters = cluster_names(NAMES, clf=CNFuzzyClassifier(threshold=0.6))
+
+    npt.assert_array_equal(clusters.labels, [0, 1, 0, 0, 2, 1])
+    npt.assert_array_equal(clusters.representatives, ["big pharma", "roga", "brenntag"])
+    npt.assert_array_equal(clusters.canonical[2], "big pharma")
+    assert len(clusters) == 3
+
+
+def test_cluster_names_n_jobs():
+    df = load_pairs().head(300)
+    names = list(df["name_1"]) + list(df["name_2"])
+    clf = CNFuzzyClassifier(threshold=0.7)
+
+    clusters = cluster_names(names, clf=clf, index=BlockingIndex(chunk_size=100))
+    parallel = cluster_names(
+        names, clf=clf, index=BlockingIndex(chunk_size=100), n_jobs=2
+    )
+
+    npt.assert_array_equal(clusters.labels, parallel.labels)
+    npt.assert_array_equal(clusters.representatives, parallel.representatives)
+    assert len(clusters) < len(set(names))
+
+
+def test_imap_bounded_is_lazy():
+    produced = []
+
+    def items():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        results = _imap_bounded(pool, abs, items(), window=4)
+        first = next(results)
+
+        # the window and the item waiting for a free slot
+        assert len(produced) <= 5
+        assert sorted([first, *results]) == list(range(100))
+
+
+def test_cluster_stream():
+    clf = CNFuzzyClassifier(threshold=0.6)
+    normalizer = FusedNormalizer(steps=["Lowercaser"])
+
+    clusters = cluster_stream(NAMES, clf=clf, normalizer=normalizer, chunk_size=4)
+    expected = cluster_names(NAMES, clf=clf)
+
+    npt.assert_array_equal(clusters.labels, expected.labels)
+    npt.assert_array_equal(clusters.representatives, expected.representatives)
+    assert len(cluster_stream([], clf=clf, normalizer=normalizer)) == 0
@@ -0,0 +1,174 @@
+import pickle
+from types import SimpleNamespace
+
+import numpy as np
+import numpy.testing as npt
+import pytest
+from sklearn.exceptions import NotFittedError
+from sklearn.model_selection import StratifiedKFold, cross_val_score
+
+from benchmarks.suite import load_pairs
+from cmnsim.fuzzy_clf import (
+    CNFuzzyClassifier,
+    _cross_val_accuracy,
+    _CrossValObjective,
+    _scaled_mean,
+    _tuning_features,
+)
+from cmnsim.scoring import score_pairs
+
+PAIRS = [["big pharma", "pharma big"], ["Brenntag", "Brenntag Group"]]
+
+CANDIDATES = [
+    "Big Pharma LLC",
+    "Roga i Kopyta",
+    "Pharma Big",
+    "Brenntag Group",
+    "Big Pharma",
+    "Brenntag Australia (Pty) Ltd.",
+]
+
+
+def _brute_force(clf, query, k, cutoff):
+    pred = score_pairs([[query, c] for c in CANDIDATES]) * clf._weights()
+    scores = _scaled_mean(pred, *clf._bounds())
+    order = np.lexsort((np.arange(len(scores)), -scores))
+    return [
+        (CANDIDATES[i], float(scores[i]), int(i)) for i in order if scores[i] > cutoff
+    ][:k]
+
+
+def test_match():
+    clf = CNFuzzyClassifier()
+
+    matches = clf.match("big pharma", CANDIDATES, k=2, cutoff=0)
+    assert [index for _, _, index in matches] == [4, 0]
+    assert matches == _brute_force(clf, "big pharma", 2, 0)
+
+
+def test_match_cutoff():
+    clf = CNFuzzyClassifier(w_pred_ratio=0.9, w_pred_partial_ratio=0.05)
+
+    for cutoff in [0, 0.3, 0.6, 0.9]:
+        assert clf.match("Brenntag", CANDIDATES, k=3, cutoff=cutoff) == _brute_force(
+            clf, "Brenntag", 3, cutoff
+        )
+
+
+def test_match_cutoff_is_exclusive():
+    clf = CNFuzzyClassifier()
+    best = clf.match("big pharma", CANDIDATES, k=1, cutoff=-np.inf)[0]
+
+    assert clf.match("big pharma", CANDIDATES, k=1, cutoff=best[1]) != [best]
+
+
+def test_match_negative_weights():
+    clf = CNFuzzyClassifier(w_pred_partial_ratio=-0.3, w_pred_token_set_ratio=-0.1)
+
+    for k, cutoff in [(1, -np.inf), (3, -np.inf), (2, 0.1), (6, 0.2)]:
+        assert clf.match("Big Pharma", CANDIDATES, k=k, cutoff=cutoff) == _brute_force(
+            clf, "Big Pharma", k, cutoff
+        )
+
+
+def test_match_many():
+    clf = CNFuzzyClassifier()
+    matches = clf.match_many(["big pharma", "brenntag"], CANDIDATES, k=1, cutoff=0)
+
+    assert [m[0][0] for m in matches] == ["Big Pharma", "Brenntag Group"]
+    assert clf.match_many([], CANDIDATES) == []
+    assert clf.match("big pharma", [], cutoff=0) == []
+
+
+def test_cross_val_accuracy():
+    df = load_pairs().sample(300, random_state=0)
+    X, y = df[["name_1", "name_2"]], df["is_duplicate"]
+
+    features = score_pairs(X.to_numpy())
+    folds = [t for _, t in StratifiedKFold(n_splits=5).split(features, y)]
+
+    for threshold in [0.2, 0.4]:
+        clf = CNFuzzyClassifier(threshold=threshold, w_pred_ratio=0.6)
+        assert (
+            _cross_val_accuracy(clf, features, y.to_numpy(), folds)
+            == cross_val_score(clf, X, y, cv=5).mean()
+        )
+
+
+def test_tuning_features(tmp_path):
+    X = np.array(PAIRS, dtype=object)
+    session = tmp_path.joinpath("tuning_1")
+    session.mkdir()
+
+    features = _tuning_features(X, session)
+    npt.assert_array_equal(features, score_pairs(X))
+    assert len(list(session.glob("features_*.npy"))) == 1
+
+    other = tmp_path.joinpath("tuning_2")
+    other.mkdir()
+    npt.assert_array_equal(_tuning_features(X, other), features)
+    assert not list(other.glob("features_*.npy"))
+
+
+def test_cross_val_objective(tmp_path):
+    df = load_pairs().sample(300, random_state=0)
+    X, y = df[["name_1", "name_2"]].to_numpy(), df["is_duplicate"].to_numpy()
+
+    features = score_pairs(X)
+    folds = [t for _, t in StratifiedKFold(n_splits=5).split(features, y)]
+    objective = pickle.loads(
+        pickle.dumps(_CrossValObjective(tmp_path, features, y, folds))
+    )
+
+    params = {"threshold": 0.3, "w_pred_ratio": 0.6}
+    clf = CNFuzzyClassifier(**params)
+    assert objective(SimpleNamespace(params=params)) == 1 - _cross_val_accuracy(
+        clf, features, y, folds
+    )
+    assert isinstance(objective._features, np.memmap)
+
+
+def test_calibrate():
+    df = load_pairs().sample(300, random_state=0)
+    X, y = df[["name_1", "name_2"]].to_numpy(), df["is_duplicate"].to_numpy()
+
+    clf = CNFuzzyClassifier(calibrate=True).fit(X, y)
+    proba = clf.predict_proba(X)
+
+    npt.assert_array_equal(
+        np.concatenate(list(clf.iter_predict_proba(iter(X.tolist()), chunk_size=7))),
+        proba,
+    )
+    npt.assert_array_equal(clf.predict_proba(X[[5]]), proba[[5]])
+
+    features = score_pairs(X)
+    folds = [t for _, t in StratifiedKFold(n_splits=5).split(features, y)]
+    assert (
+        _cross_val_accuracy(clf, features, y, folds)
+        == cross_val_score(clf, X, y, cv=5).mean()
+    )
+
+
+@pytest.mark.parametrize("threshold", [0.5, 0.7, 0.9])
+def test_cascade(threshold):
+    df = load_pairs().sample(500, random_state=0)
+    X, y = df[["name_1", "name_2"]].to_numpy(), df["is_duplicate"].to_numpy()
+
+    clf = CNFuzzyClassifier(threshold=threshold, calibrate=True).fit(X, y)
+    cascade = CNFuzzyClassifier(threshold=threshold, calibrate=True, cascade=True)
+    cascade.fit(X, y)
+
+    npt.assert_array_equal(cascade.predict(X), clf.predict(X))
+    assert cascade.cascade_stats_["pairs"] == len(X)
+    assert 0 < cascade.cascade_stats_["early_exit_rate"] <= 1
+
+
+def test_calibrate_not_fitted():
+    with pytest.raises(NotFittedError):
+        CNFuzzyClassifier(calibrate=True).predict_proba([["a", "b"]])
+
+    with pytest.raises(ValueError):
+        list(CNFuzzyClassifier().iter_predict_proba([["a", "b"]]))
+
+    with pytest.raises(ValueError):
+        CNFuzzyClassifier(cascade=True).predict([["a", "b"]])
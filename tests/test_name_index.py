@@ -0,0 +1,65 @@
+import numpy.testing as npt
+
+from cmnsim.name_index import NameIndex
+
+NAMES = ["big pharma", "roga i kopyta", "brenntag", "pharma big llc", "big pharmacy"]
+
+
+def test_search():
+    index = NameIndex().fit(NAMES)
+    [(indices, similarity)] = index.search(["pharma big"], k=3)
+
+    assert set(indices) == {0, 3, 4}
+    assert (similarity[:-1] >= similarity[1:]).all()
+    npt.assert_allclose(similarity[0], 1)
+    assert index.search(["xyz"])[0][0].size == 0
+
+
+def test_add():
+    index = NameIndex().fit(NAMES[:2]).add(NAMES[2:])
+    fitted = NameIndex().fit(NAMES)
+
+    for (indices, similarity), (expected, expected_similarity) in zip(
+        index.search(NAMES), fitted.search(NAMES)
+    ):
+        npt.assert_array_equal(indices, expected)
+        npt.assert_allclose(similarity, expected_similarity)
+
+
+def test_query():
+    index = NameIndex().fit(NAMES)
+    matches = index.query(["big pharma ltd"], k=2)[0]
+
+    assert len(matches) == 2
+    assert matches[0][1] >= matches[1][1]
+    assert all(NAMES[i] == name for name, _, i in matches)
+
+
+def test_save_load(tmp_path):
+    index = NameIndex(ngram=4).fit(NAMES)
+    index.save(tmp_path.joinpath("index.npz"))
+    loaded = NameIndex.load(tmp_path.joinpath("index.npz"))
+
+    assert loaded.names == NAMES
+    assert loaded.ngram == 4
+    assert loaded.query(NAMES) == index.query(NAMES)
+
+
+def test_add_pending():
+    index = NameIndex(max_pending=10).fit(NAMES[:2])
+    index.search(NAMES[:1])
+    index.add(NAMES[2:])
+
+    # added names are searchable before they are merged
+    assert index._n_pending == 3
+    assert 2 in index.search(["brenntag"])[0][0]
+
+    fitted = NameIndex().fit(NAMES)
+    for (indices, similarity), (expected, expected_similarity) in zip(
+        index.rebuild().search(NAMES), fitted.search(NAMES)
+    ):
+        npt.assert_array_equal(indices, expected)
+        npt.assert_allclose(similarity, expected_similarity)
+
+    assert index._n_pending == 0
+    assert NameIndex(max_pending=1).fit(NAMES[:2]).add(NAMES[2:])._n_pending == 0
@@ -1,14 +1,24 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
 import numpy.testing as npt
+import pytest
 
+from cmnsim.misc.spacy_wrapper import needs_ner
 from cmnsim.preprocessing import (
     CleancoCleaner,
     FullTransformersPipeline,
+    FusedNormalizer,
     Lowercaser,
     NotWordsEliminator,
     NumbersEliminator,
     RusStopWordsCleaner,
     Spacy,
     Unidecoder,
+    default_steps,
+    validate_fast_path,
 )
 
 
@@ -54,6 +64,27 @@ def test_rus_stop_words_cleaner():
     )
 
 
+def test_rus_stop_words_cleaner_tokens():
+    cleaner = RusStopWordsCleaner()
+
+    npt.assert_array_equal(
+        cleaner.transform(["ЗАО заокеанский банк", "Банк АО", "ао-групп"]),
+        ["заокеанский банк", "Банк", "-"],
+    )
+
+
+def test_rus_stop_words_cleaner_file(tmp_path):
+    path = tmp_path / "stop_words.txt"
+    path.write_text("# legal forms\nGmbH\n\nllc\n", encoding="utf-8")
+    cleaner = RusStopWordsCleaner(stop_words_file=path)
+
+    npt.assert_array_equal(
+        cleaner.transform(["Bauder GmbH", "Big Pharma LLC", "ООО Рога"]),
+        ["Bauder", "Big Pharma", "Рога"],
+    )
+    assert cleaner.fingerprint() != RusStopWordsCleaner().fingerprint()
+
+
 def test_unidecoder():
     unidecoder = Unidecoder()
     npt.assert_array_equal(
@@ -70,6 +101,50 @@ def test_spacy():
     )
 
 
+def test_spacy_batched():
+    names = ["VK mobile version | VK", "Some Big Pharma, LLC", "ооо рога и копыта"]
+    npt.assert_array_equal(
+        Spacy(batch_size=2).transform(names),
+        Spacy().transform(names),
+    )
+
+
+def test_spacy_fast_path():
+    sp = Spacy(fast_path=True)
+    npt.assert_array_equal(
+        sp.transform(["Big Pharma", "ооо рога копыта"]),
+        ["Big Pharma", "ооо рога копыта"],
+    )
+    assert sp.path_counts == {"fast": 2, "ner": 0}
+    assert sp.transform_one("VK") == "VK"
+    assert sp.path_counts == {"fast": 3, "ner": 0}
+    assert sp.fingerprint() != Spacy().fingerprint()
+
+
+def test_needs_ner():
+    assert not needs_ner("Big Pharma")
+    assert needs_ner("VK mobile version | VK")
+    assert needs_ner("Big Pharma (Moscow)")
+    assert needs_ner("Some Big Pharma Company Group")
+    assert not needs_ner("Some Big Pharma Company Group", max_tokens=5)
+
+
+def test_default_steps():
+    steps = default_steps(fast_path=True)
+    spacy = [step for step in steps if isinstance(step, Spacy)]
+
+    assert len(steps) == len(FusedNormalizer()._stages())
+    assert len(spacy) == 1 and spacy[0].fast_path
+    assert "Spacy" not in steps
+
+
+def test_validate_fast_path():
+    report = validate_fast_path(["Big Pharma", "VK mobile version | VK"])
+    assert report["fast"] == 1
+    assert report["ner"] == 1
+    assert report["differ"] == 0
+
+
 def test_pipeline():
     pipeline = FullTransformersPipeline()
 
@@ -84,3 +159,107 @@ def test_pipeline():
         ),
         ["big pharma", "big pharma", "roga i kopyta", "roga i kopyta"],
     )
+
+
+def test_fused_normalizer():
+    names = [
+        '"Big Pharma", LTD',
+        '"Big Pharma 123", LLC',
+        'ооо 123 "рога и копыта групп" 456',
+        "ооо рога и копыта групп",
+        "  a  1 2 b",
+    ]
+
+    npt.assert_array_equal(
+        FusedNormalizer().transform(names),
+        FullTransformersPipeline().transform(names),
+    )
+
+
+def test_fused_normalizer_steps():
+    steps = [
+        "RusStopWordsCleaner",
+        "CleancoCleaner",
+        "NumbersEliminator",
+        "NotWordsEliminator",
+        "Unidecoder",
+        "Lowercaser",
+    ]
+    names = ['ооо 123 "рога и копыта групп" 456', '"Big Pharma 123", LLC', " ЗАОао "]
+
+    expected = names
+    for step in steps:
+        expected = globals()[step]().transform(expected)
+
+    npt.assert_array_equal(FusedNormalizer(steps=steps).transform(names), expected)
+    assert FusedNormalizer(steps=steps).normalize(names[0]) == expected[0]
+
+
+def test_fused_normalizer_n_jobs():
+    steps = ["RusStopWordsCleaner", "NumbersEliminator", "Unidecoder", "Lowercaser"]
+    names = [
+        f"ООО Рога и Копыта {i}" if i % 2 else f"Big Pharma {i}" for i in range(50)
+    ]
+
+    expected = FusedNormalizer(steps=steps).transform(names)
+
+    normalizer = FusedNormalizer(steps=steps, n_jobs=2, chunk_size=7)
+    try:
+        npt.assert_array_equal(normalizer.transform(names), expected)
+
+        # the pool is restarted with the new number of workers
+        normalizer.n_jobs = 3
+        npt.assert_array_equal(normalizer.transform(names), expected)
+        assert normalizer._executor._max_workers == 3
+    finally:
+        normalizer.close()
+
+
+def test_import_is_lazy():
+    heavy = ("spacy", "pandas", "cleanco", "unidecode", "sklearn.pipeline")
+    code = (
+        "import sys\n"
+        "import cmnsim.preprocessing\n"
+        f"print(*[m for m in {heavy!r} if m in sys.modules])\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=Path(__file__).parent.parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert result.stdout.strip() == ""
+
+
+# seconds, generous: `sklearn.base` alone takes about 1s, the eager
+# imports took more than 2s
+IMPORT_TIME_BUDGET = 3.0
+
+
+@pytest.mark.skipif(
+    bool(os.getenv("CMNSIM_SKIP_TIMING")), reason="timing is unreliable here"
+)
+def test_import_time():
+    code = (
+        "import time\n"
+        "start = time.perf_counter()\n"
+        "import cmnsim.preprocessing\n"
+        "print(time.perf_counter() - start)\n"
+    )
+    # the best of a few runs, so a busy machine does not fail the test
+    elapsed = min(
+        float(
+            subprocess.run(
+                [sys.executable, "-c", code],
+                cwd=Path(__file__).parent.parent,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+        )
+        for _ in range(3)
+    )
+
+    assert elapsed < IMPORT_TIME_BUDGET
@@ -0,0 +1,36 @@
+from cmnsim.preprocessing import FusedNormalizer, Lowercaser, NumbersEliminator
+from cmnsim.profiling import profile, profiler
+
+
+def test_disabled_by_default():
+    profiler.reset()
+    Lowercaser().transform(["A"])
+
+    assert profiler.stats == {}
+
+
+def test_stage_stats():
+    with profile() as stats:
+        Lowercaser().transform(["AB", "Cd"])
+        NumbersEliminator().transform(["A 1"])
+        Lowercaser().transform(["Ё"])
+
+    lowercaser = stats.stats["Lowercaser"]
+    assert lowercaser.calls == 2
+    assert lowercaser.items == 3
+    assert lowercaser.bytes_in == 6
+    assert lowercaser.seconds > 0
+    assert stats.stats["NumbersEliminator"].bytes_out == 1
+    assert not profiler.enabled
+
+
+def test_fused_normalizer_stages():
+    steps = ["NumbersEliminator", "Lowercaser"]
+
+    with profile() as stats:
+        result = FusedNormalizer(steps=steps).transform(["A 1", "B"])
+
+    assert list(result) == ["a", "b"]
+    assert set(stats.as_dict()) == {*steps, "FusedNormalizer"}
+    assert stats.stats["NumbersEliminator"].items == 2
+    assert "Lowercaser" in stats.report()
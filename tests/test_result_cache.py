@@ -0,0 +1,129 @@
+import asyncio
+
+from gateway.search_engine.result_cache import SearchCache, normalize_query
+
+
+class FakeRedis:
+    """Async redis stub with the commands used by `SearchCache`."""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+        self.ttls[key] = ex
+
+    async def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+
+    async def hgetall(self, key):
+        return {k: str(v) for k, v in self.data.get(key, {}).items()}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def hincrby(self, key, field, amount):
+        self.commands.append((key, field, amount))
+
+    def hincrbyfloat(self, key, field, amount):
+        self.commands.append((key, field, amount))
+
+    async def execute(self):
+        for key, field, amount in self.commands:
+            fields = self.redis.data.setdefault(key, {})
+            fields[field] = fields.get(field, 0) + amount
+
+
+def _results(query, matches):
+    return {"query": {"query_string": query, "matches": matches}}
+
+
+def _run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_normalize_query():
+    assert normalize_query("  Big   PHARMA ") == "big pharma"
+
+
+def test_get_set():
+    async def scenario():
+        cache = SearchCache(FakeRedis(), "test", ttl=300)
+
+        version, results = await cache.get("Big Pharma")
+        assert results is None
+
+        await cache.set("Big Pharma", version, _results("Big Pharma", ["big pharma"]))
+        _, results = await cache.get("big  pharma")
+        assert results == _results("big  pharma", ["big pharma"])
+
+    _run(scenario())
+
+
+def test_invalidate():
+    async def scenario():
+        cache = SearchCache(FakeRedis(), "test")
+
+        version, _ = await cache.get("big pharma")
+        await cache.set("big pharma", version, _results("big pharma", ["big pharma"]))
+        await cache.invalidate()
+
+        new_version, results = await cache.get("big pharma")
+        assert new_version != version
+        assert results is None
+
+        # results computed before the insert are not cached under the new version
+        await cache.set("roga", version, _results("roga", ["roga"]))
+        assert (await cache.get("roga"))[1] is None
+
+    _run(scenario())
+
+
+def test_negative_ttl():
+    async def scenario():
+        redis = FakeRedis()
+        cache = SearchCache(redis, "test", ttl=300, negative_ttl=60)
+        version, _ = await cache.get("unknown")
+
+        # empty results may change after crawling
+        await cache.set("unknown", version, _results("unknown", []), final=False)
+        assert (await cache.get("unknown"))[1] is None
+
+        await cache.set("unknown", version, _results("unknown", []), final=True)
+        assert (await cache.get("unknown"))[1] == _results("unknown", [])
+        assert list(redis.ttls.values()) == [60]
+
+        no_negative = SearchCache(FakeRedis(), "test", negative_ttl=0)
+        await no_negative.set("unknown", version, _results("unknown", []))
+        assert (await no_negative.get("unknown"))[1] is None
+
+    _run(scenario())
+
+
+def test_metrics():
+    async def scenario():
+        cache = SearchCache(FakeRedis(), "test")
+        assert (await cache.metrics())["hit_rate"] == 0.0
+
+        await cache.record(True, 0.001)
+        await cache.record(False, 0.1)
+        await cache.record(False, 0.3)
+
+        metrics = await cache.metrics()
+        assert metrics["hits"] == 1
+        assert metrics["misses"] == 2
+        assert abs(metrics["hit_rate"] - 1 / 3) < 1e-9
+        assert abs(metrics["hit_latency_ms"] - 1) < 1e-6
+        assert abs(metrics["miss_latency_ms"] - 200) < 1e-6
+
+    _run(scenario())
@@ -0,0 +1,69 @@
+from gateway.search_engine.schemas import (
+    document_id,
+    elastic_relevant_response,
+    elastic_upsert,
+)
+
+
+def _data(url="https://roga.ru", query="roga"):
+    return {
+        "company_name": "Roga i kopyta",
+        "normalized_name": "roga i kopyta",
+        "company_url": url,
+        "query_string": query,
+    }
+
+
+def _hit(name, score, url=""):
+    return {
+        "_score": score,
+        "_source": {
+            "company_name": name.capitalize(),
+            "normalized_name": name,
+            "company_url": url,
+            "query_string": name,
+        },
+    }
+
+
+def test_document_id():
+    assert document_id("roga i kopyta") == document_id("  Roga  I\tKOPYTA ")
+    assert document_id("roga i kopyta") != document_id("roga kopyta")
+
+
+def test_elastic_upsert():
+    data = _data()
+
+    for policy in ("none", "fill", "overwrite"):
+        body = elastic_upsert(data, policy)
+        assert body["upsert"] == data
+        assert body["script"]["params"]["overwrite"] == (policy == "overwrite")
+
+    assert elastic_upsert(data, "none")["script"]["params"]["doc"] == {}
+    for policy in ("fill", "overwrite"):
+        doc = elastic_upsert(data, policy)["script"]["params"]["doc"]
+        assert doc == {"company_url": "https://roga.ru", "query_string": "roga"}
+
+    # empty fields do not clear existing ones
+    doc = elastic_upsert(_data(url=""), "overwrite")["script"]["params"]["doc"]
+    assert doc == {"query_string": "roga"}
+
+
+def test_elastic_relevant_response():
+    hits = [
+        _hit("roga i kopyta", 5.0, url="https://roga.ru"),
+        _hit("roga i kopyta", 3.0, url="https://kopyta.ru"),
+        _hit("roga", 2.0),
+        _hit("kopyta", 0.001),
+    ]
+
+    matches = elastic_relevant_response("roga i kopyta", hits)["query"]["matches"]
+
+    # the first, best scored hit of a name is kept, low scored hits are dropped
+    assert [match["normalized_name"] for match in matches.values()] == [
+        "roga i kopyta",
+        "roga",
+    ]
+    first = next(iter(matches.values()))
+    assert first["company_url"] == "https://roga.ru"
+    assert first["score"] == 1.0
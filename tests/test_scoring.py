@@ -0,0 +1,103 @@
+import numpy as np
+import numpy.testing as npt
+import pytest
+
+from cmnsim.fuzzy_clf import CNFuzzyClassifier
+from cmnsim.scoring import (
+    FEATURES,
+    TokenCache,
+    _has_rapidfuzz,
+    score_pairs,
+    subs_ratio,
+    tokenize,
+)
+
+PAIRS = [
+    ["big pharma", "pharma big"],
+    ['"Big Pharma", LTD', "Big Pharma LLC"],
+    ["ооо рога и копыта", "рога и копыта групп"],
+    ["JX Nippon Oil & Gas", "JX Nippon Oil & Gas Exploration Technical Services"],
+    ["", "Brenntag"],
+    ["Brenntag", "Brenntag"],
+]
+
+
+def test_score_pairs():
+    scores = score_pairs(PAIRS, backend="fuzzywuzzy")
+
+    assert scores.shape == (len(PAIRS), len(FEATURES))
+    npt.assert_array_equal(scores[0], [60, 60, 100, 1, 100])
+    npt.assert_array_equal(scores[-2], [0, 0, 0, 0, 0])
+    npt.assert_array_equal(scores[-1], [100, 100, 100, 1, 100])
+
+
+def test_score_pairs_empty():
+    assert score_pairs(np.empty((0, 2), dtype=object)).shape == (0, len(FEATURES))
+
+
+def test_score_pairs_features():
+    features = ["token_set_ratio", "ratio"]
+
+    npt.assert_array_equal(
+        score_pairs(PAIRS, chunk_size=2, n_jobs=2, features=features),
+        score_pairs(PAIRS)[:, [FEATURES.index(f) for f in features]],
+    )
+
+
+@pytest.mark.skipif(not _has_rapidfuzz(), reason="rapidfuzz is not installed")
+def test_score_pairs_rapidfuzz():
+    npt.assert_array_equal(
+        score_pairs(PAIRS, backend="rapidfuzz"),
+        score_pairs(PAIRS, backend="fuzzywuzzy"),
+    )
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_score_pairs_chunks(executor):
+    pairs = PAIRS * 5
+
+    npt.assert_array_equal(
+        score_pairs(pairs, chunk_size=4, n_jobs=2, executor=executor),
+        score_pairs(pairs),
+    )
+
+
+def test_classifier_backends():
+    X = np.array(PAIRS[:-2], dtype=object)
+
+    npt.assert_array_equal(
+        CNFuzzyClassifier(backend="fuzzywuzzy").predict_proba(X),
+        CNFuzzyClassifier().predict_proba(X),
+    )
+
+
+def test_tokenize():
+    tokens = tokenize("Pharma, Big Pharma")
+
+    assert tokens.tokens == ["Pharma,", "Big", "Pharma"]
+    assert tokens.processed == "pharma  big pharma"
+    assert tokens.sorted_tokens == "big pharma pharma"
+    assert tokens.processed_set == {"big", "pharma"}
+
+
+def test_subs_ratio():
+    assert subs_ratio("a a b", "a c") == 3 / 5
+    assert subs_ratio("a b", "c d") == 0
+
+
+def test_token_cache():
+    cache = TokenCache(maxsize=2)
+
+    assert cache.get("a b") is cache.get("a b")
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.get_many(["c", "d"])
+    cache.get("a b")
+    assert cache.misses == 4
+
+
+def test_score_pairs_cache():
+    cache = TokenCache()
+    score_pairs(PAIRS[:3] * 10, cache=cache)
+
+    assert cache.misses == 6
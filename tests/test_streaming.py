@@ -0,0 +1,49 @@
+import io
+
+import numpy.testing as npt
+import pytest
+
+from cmnsim.preprocessing import FusedNormalizer
+from cmnsim.streaming import iter_chunks, normalize_stream, read_names
+
+NORMALIZER = FusedNormalizer(steps=["NumbersEliminator", "Lowercaser"])
+CSV = "pair_id,name_1\n1,Big Pharma 123\n2,ООО Рога\n3,\n4,Brenntag\n"
+
+
+def test_iter_chunks():
+    assert list(iter_chunks(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(iter_chunks([], 2)) == []
+
+    with pytest.raises(ValueError):
+        list(iter_chunks(range(5), 0))
+
+
+def test_normalize_iterable():
+    chunks = list(normalize_stream(iter(["A 1", "B", "C"]), NORMALIZER, chunk_size=2))
+
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    npt.assert_array_equal(chunks[0], ["a", "b"])
+
+
+@pytest.mark.parametrize("reader", ["csv", "pandas", "pyarrow"])
+def test_read_csv_path(tmp_path, reader):
+    if reader == "pyarrow":
+        pytest.importorskip("pyarrow")
+
+    path = tmp_path / "names.csv"
+    path.write_text(CSV, encoding="utf-8")
+
+    chunks = list(read_names(path, column="name_1", chunk_size=3, reader=reader))
+
+    assert chunks == [["Big Pharma 123", "ООО Рога", ""], ["Brenntag"]]
+
+
+def test_normalize_file_object():
+    chunks = normalize_stream(io.StringIO(CSV), NORMALIZER, column=1, chunk_size=10)
+
+    npt.assert_array_equal(next(chunks), ["big pharma", "ооо рога", "", "brenntag"])
+
+
+def test_unknown_column():
+    with pytest.raises(KeyError):
+        list(read_names(io.StringIO(CSV), column="name_2"))
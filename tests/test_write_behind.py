@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+
+from gateway.search_engine.write_behind import WriteBehindBuffer
+
+
+class StubStorage:
+    """`CNElasticStorage.insert_bulk` stub, which records written documents."""
+
+    def __init__(self):
+        self.written = []
+        self.error = None
+        self.statuses = {}
+        self.delay = 0.0
+        self.started = asyncio.Event()
+
+    async def insert_bulk(self, index_name, items):
+        self.started.set()
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+
+        results = []
+        for item in items:
+            status = self.statuses.get(item["normalized_name"], 200)
+            ok = status == 200
+            if ok:
+                self.written.append(item["normalized_name"])
+            results.append({"ok": ok, "status": status, "error": None if ok else "x"})
+        return results
+
+
+def _item(name):
+    return {"normalized_name": name}
+
+
+def _run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_size_trigger():
+    async def scenario():
+        storage, flushed = StubStorage(), []
+
+        async def on_flush(*names):
+            flushed.extend(names)
+
+        buffer = WriteBehindBuffer(
+            storage, "test", max_size=2, max_delay=60, on_flush=on_flush
+        )
+        buffer.add(_item("a"))
+        await asyncio.sleep(0.01)
+        assert storage.written == []
+
+        buffer.add(_item("b"))
+        await asyncio.sleep(0.01)
+        assert storage.written == ["a", "b"]
+        assert flushed == ["a", "b"]
+
+    _run(scenario())
+
+
+def test_delay_trigger():
+    async def scenario():
+        storage = StubStorage()
+        buffer = WriteBehindBuffer(storage, "test", max_size=100, max_delay=0.01)
+        buffer.start()
+
+        buffer.add(_item("a"))
+        await asyncio.sleep(0.05)
+        assert storage.written == ["a"]
+
+        buffer.add(_item("b"))
+        await buffer.close()
+        assert storage.written == ["a", "b"]
+
+    _run(scenario())
+
+
+def test_failure_requeues_items():
+    async def scenario():
+        storage = StubStorage()
+        buffer = WriteBehindBuffer(storage, "test", max_size=100, max_delay=10)
+
+        storage.error = ConnectionError("ES is down")
+        buffer.add(_item("a"))
+        with pytest.raises(ConnectionError):
+            await buffer.flush()
+
+        # the batch is kept and background flushes back off
+        buffer.add(_item("b"))
+        assert [item["normalized_name"] for item in buffer._items] == ["a", "b"]
+        assert buffer._backing_off()
+
+        storage.error = None
+        storage.statuses = {"a": 503, "b": 400}
+        await buffer.flush()
+        assert [item["normalized_name"] for item in buffer._items] == ["a"]
+
+        storage.statuses = {}
+        await buffer.flush()
+        assert storage.written == ["a"]
+        assert buffer._items == []
+        assert not buffer._backing_off()
+
+    _run(scenario())
+
+
+def test_buffer_is_bounded():
+    async def scenario():
+        storage = StubStorage()
+        storage.error = ConnectionError("ES is down")
+        buffer = WriteBehindBuffer(storage, "test", max_size=2, max_buffer=3)
+
+        for name in "abcde":
+            buffer.add(_item(name))
+            await asyncio.sleep(0)
+
+        assert [item["normalized_name"] for item in buffer._items] == ["c", "d", "e"]
+
+        await buffer.close()
+        assert buffer._items == []
+
+    _run(scenario())
+
+
+def test_close_during_flush():
+    async def scenario():
+        storage = StubStorage()
+        storage.delay = 10
+        buffer = WriteBehindBuffer(storage, "test", max_size=100, max_delay=0.01)
+        buffer.start()
+
+        buffer.add(_item("a"))
+        await asyncio.wait_for(storage.started.wait(), 1)
+
+        # the cancelled periodic flush puts the batch back for the final one
+        storage.delay = 0
+        await buffer.close()
+        assert storage.written == ["a"]
+        assert buffer._items == []
+
+    _run(scenario())